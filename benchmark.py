@@ -0,0 +1,305 @@
+"""Benchmark of the track_eyes hot path.
+
+Times every stage of one tracking iteration (grayscale conversion, face and eye
+detectMultiScale, left/right eye association and pupil localisation, resize, drawing, RGBA conversion, PhotoImage update) over
+synthetic face frames and/or recorded clips, for a grid of resolutions and
+cascade parameters, and writes p50/p95/p99 latencies and FPS as JSON.
+The display path alone is also compared against the allocating one it replaced
+(time per frame and peak allocation).
+
+    python benchmark.py -o bench.json
+    python benchmark.py --clip session_webcam.avi --resolutions 1920x1080 -o bench.json
+    python benchmark.py -o new.json --compare bench.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from sample_store import MISSING
+from tracking_engine import EyeTracker, draw_detections, eye_sample, scale_detections
+from ui_bridge import DisplayBuffers
+
+STAGES = ('gray', 'face_detect', 'eye_detect', 'pupil', 'resize', 'draw', 'rgb', 'photoimage')
+SAMPLING_RATES = (10, 30, 60, 120)
+DISPLAY_SIZE = (400, 300)
+
+
+def synthetic_frame(width, height, seed=0):
+    # Deterministic face-like test card: textured background, skin ellipse, eyes, brows, mouth
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    cx = width // 2 + int(rng.integers(-width // 20, width // 20 + 1))
+    cy = height // 2 + int(rng.integers(-height // 20, height // 20 + 1))
+    fw, fh = width // 6, int(height / 3.2)
+
+    cv2.ellipse(frame, (cx, cy), (fw, fh), 0, 0, 360, (150, 180, 220), -1)
+    for side in (-1, 1):
+        ex, ey = cx + side * fw // 2, cy - fh // 5
+        cv2.ellipse(frame, (ex, ey), (fw // 5, fh // 10), 0, 0, 360, (240, 240, 240), -1)
+        cv2.circle(frame, (ex, ey), max(fh // 14, 2), (30, 30, 30), -1)
+        cv2.line(frame, (ex - fw // 4, ey - fh // 6), (ex + fw // 4, ey - fh // 6), (40, 40, 60), max(fh // 30, 2))
+    cv2.ellipse(frame, (cx, cy + fh // 2), (fw // 3, fh // 12), 0, 0, 180, (60, 60, 150), max(fh // 40, 2))
+    return cv2.GaussianBlur(frame, (5, 5), 0)
+
+
+def synthetic_frames(width, height, count):
+    return [synthetic_frame(width, height, seed) for seed in range(count)]
+
+
+def clip_frames(path, count, size=None):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, size) if size else frame)
+    capture.release()
+    return frames
+
+
+def photo_factory():
+    # Returns (show, new_photo, has_tk). show(image) pastes into one persistent PhotoImage like
+    # PhotoSurface; new_photo(image) builds a PhotoImage per frame like the old display path.
+    # ImageTk needs a Tk interpreter; without a display both only touch the PIL image.
+    try:
+        import tkinter as tk
+        from PIL import ImageTk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return lambda image: image, lambda image: image, False
+
+    photos = {}
+
+    def show(image):
+        photo = photos.get(image.size)
+        if photo is None:
+            photo = photos[image.size] = ImageTk.PhotoImage(image.mode, image.size)
+        photo.paste(image)
+        return photo
+
+    return show, lambda image: ImageTk.PhotoImage(image=image), True
+
+
+def run_pipeline(frames, tracker, make_photo, display_size=DISPLAY_SIZE):
+    # One sampled iteration of track_eyes, EyeTracker.detect split into its steps and timed
+    # per stage (seconds)
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    clock = time.perf_counter
+    display = DisplayBuffers(display_size)
+
+    for frame in frames:
+        tracker.reset_tracking()
+        t0 = clock()
+        gray = tracker.face_search_image(frame)
+        t1 = clock()
+        faces = tracker.find_faces(gray)
+        t2 = clock()
+        detections = tracker.find_face_eyes(frame, gray, faces)
+        t3 = clock()
+        eyes = eye_sample(detections, frame)
+        t4 = clock()
+        display_frame = display.resize(frame)
+        t5 = clock()
+        factor_x = display_frame.shape[1] / frame.shape[1]
+        factor_y = display_frame.shape[0] / frame.shape[0]
+        draw_detections(display_frame, scale_detections(detections, factor_x, factor_y),
+                        [(int(cx * factor_x), int(cy * factor_y)) for cx, cy in (eyes[:2], eyes[2:]) if cx != MISSING])
+        t6 = clock()
+        image = display.publish()
+        t7 = clock()
+        make_photo(image)
+        t8 = clock()
+
+        marks = (t0, t1, t2, t3, t4, t5, t6, t7, t8)
+        for stage, start, end in zip(STAGES, marks, marks[1:]):
+            timings[stage].append(end - start)
+        totals.append(t8 - t0)
+
+    return timings, totals
+
+
+def legacy_display(frame, display_size, new_photo):
+    # The display path before reusable buffers: copy, RGB conversion at full size, resize,
+    # new PIL image and new PhotoImage for every frame
+    display_frame = cv2.cvtColor(frame.copy(), cv2.COLOR_BGR2RGB)
+    display_frame = cv2.resize(display_frame, display_size)
+    return new_photo(Image.fromarray(display_frame))
+
+
+def benchmark_display(frames, show, new_photo, display_size=DISPLAY_SIZE, warmup=3):
+    # Per-frame time and peak traced allocation (NumPy arrays) of the old and the buffered display path
+    display = DisplayBuffers(display_size)
+    paths = {
+        'legacy': lambda frame: legacy_display(frame, display_size, new_photo),
+        'buffered': lambda frame: show(display.render(frame))
+    }
+    results = {}
+    for name, render in paths.items():
+        for frame in frames[:warmup]:
+            render(frame)
+
+        durations = []
+        for frame in frames:
+            start = time.perf_counter()
+            render(frame)
+            durations.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for frame in frames:
+            render(frame)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = dict(summarize(durations),
+                             peak_bytes=peak - before,
+                             retained_bytes=current - before)
+    return results
+
+
+def summarize(values):
+    ms = np.asarray(values) * 1000
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean())
+    }
+
+
+def benchmark_config(name, frames, scale_factor, min_neighbors, detection_scale, make_photo, warmup=3):
+    tracker = EyeTracker(scale_factor, min_neighbors, detection_scale=detection_scale)
+    run_pipeline(frames[:warmup], tracker, make_photo)
+    timings, totals = run_pipeline(frames, tracker, make_photo)
+
+    total = summarize(totals)
+    return {
+        'input': name,
+        'resolution': f"{frames[0].shape[1]}x{frames[0].shape[0]}",
+        'scale_factor': scale_factor,
+        'min_neighbors': min_neighbors,
+        'detection_scale': detection_scale,
+        'frames': len(frames),
+        'stages': {stage: summarize(values) for stage, values in timings.items()},
+        'total': total,
+        'fps': 1000.0 / total['mean_ms'] if total['mean_ms'] else 0.0,
+        # Whether the p95 iteration fits the sampling interval of each UI rate
+        'fits_rate': {str(rate): total['p95_ms'] <= 1000.0 / rate for rate in SAMPLING_RATES}
+    }
+
+
+def config_key(result):
+    return (result['input'], result['resolution'], result['scale_factor'],
+            result['min_neighbors'], result['detection_scale'])
+
+
+def compare_results(results, baseline, threshold=0.10):
+    # Returns the configurations whose p95 total latency grew by more than threshold
+    previous = {config_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(config_key(result))
+        if not old:
+            continue
+        old_p95, new_p95 = old['total']['p95_ms'], result['total']['p95_ms']
+        if old_p95 > 0 and (new_p95 - old_p95) / old_p95 > threshold:
+            regressions.append((result, old_p95, new_p95))
+    return regressions
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark del ciclo di eye tracking")
+    parser.add_argument('--resolutions', nargs='+', default=['640x480', '1280x720', '1920x1080'])
+    parser.add_argument('--scale-factors', nargs='+', type=float, default=[1.1, 1.3])
+    parser.add_argument('--min-neighbors', nargs='+', type=int, default=[5])
+    parser.add_argument('--detection-scales', nargs='+', type=float, default=[1.0, 0.5])
+    parser.add_argument('--frames', type=int, default=60, help="Frame per configurazione")
+    parser.add_argument('--clip', action='append', default=[], help="Clip registrata (ripetibile)")
+    parser.add_argument('--no-synthetic', action='store_true', help="Solo clip registrate")
+    parser.add_argument('-o', '--output', default='benchmark.json')
+    parser.add_argument('--compare', help="Risultati precedenti con cui confrontare il p95")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Peggioramento tollerato del p95")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    show_photo, new_photo, has_tk = photo_factory()
+
+    inputs = []
+    for resolution in args.resolutions:
+        width, height = parse_resolution(resolution)
+        if not args.no_synthetic:
+            inputs.append(('synthetic', synthetic_frames(width, height, args.frames)))
+        for clip in args.clip:
+            inputs.append((clip, clip_frames(clip, args.frames, (width, height))))
+
+    results = []
+    for (name, frames), scale_factor, min_neighbors, detection_scale in itertools.product(
+            inputs, args.scale_factors, args.min_neighbors, args.detection_scales):
+        if not frames:
+            continue
+        result = benchmark_config(name, frames, scale_factor, min_neighbors, detection_scale, show_photo)
+        results.append(result)
+        print(f"{result['input']:>12} {result['resolution']:>9} sf={scale_factor} mn={min_neighbors} "
+              f"ds={detection_scale}: p50 {result['total']['p50_ms']:.1f} ms, "
+              f"p95 {result['total']['p95_ms']:.1f} ms, p99 {result['total']['p99_ms']:.1f} ms, "
+              f"{result['fps']:.1f} FPS")
+
+    display_results = []
+    for name, frames in inputs:
+        if not frames:
+            continue
+        display = benchmark_display(frames, show_photo, new_photo)
+        display_results.append(dict(input=name, resolution=f"{frames[0].shape[1]}x{frames[0].shape[0]}",
+                                    **display))
+        print(f"{name:>12} display {display_results[-1]['resolution']:>9}: "
+              f"{display['legacy']['mean_ms']:.2f} -> {display['buffered']['mean_ms']:.2f} ms/frame, "
+              f"picco {display['legacy']['peak_bytes'] / 1024:.0f} -> {display['buffered']['peak_bytes'] / 1024:.0f} KiB")
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            # Without Tk the 'photoimage' stage has nothing to convert and times a no-op
+            'photoimage': 'ImageTk.PhotoImage' if has_tk else 'nessun display (fase non misurata)'
+        },
+        'results': results,
+        'display': display_results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Risultati salvati in: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+        for result, old_p95, new_p95 in regressions:
+            print(f"REGRESSIONE {result['input']} {result['resolution']} sf={result['scale_factor']} "
+                  f"ds={result['detection_scale']}: p95 {old_p95:.1f} -> {new_p95:.1f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
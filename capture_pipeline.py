@@ -0,0 +1,151 @@
+import collections
+import threading
+import time
+
+# What FrameRingBuffer.put does when the buffer is full
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+BLOCK = 'block'
+
+# media is the MediaClockState (stimulus frame on screen) at grab time, when a clock is attached;
+# sampled / displayed are the sampler's decisions for this frame (always True without samplers)
+CapturedFrame = collections.namedtuple('CapturedFrame',
+                                       ['index', 'timestamp', 'frame', 'media', 'sampled', 'displayed'],
+                                       defaults=[None, True, True])
+
+
+class FrameRingBuffer:
+    def __init__(self, capacity=4, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Politica di scarto sconosciuta: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.frames = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.pushed = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+
+    @property
+    def dropped(self):
+        return self.dropped_oldest + self.dropped_newest
+
+    def put(self, item):
+        # Returns False when the item was dropped or the buffer is closed
+        with self.condition:
+            if self.policy == BLOCK:
+                while len(self.frames) >= self.capacity and not self.closed:
+                    self.condition.wait()
+
+            if self.closed:
+                return False
+
+            if len(self.frames) >= self.capacity:
+                if self.policy == DROP_NEWEST:
+                    self.dropped_newest += 1
+                    return False
+                self.frames.popleft()
+                self.dropped_oldest += 1
+
+            self.frames.append(item)
+            self.pushed += 1
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        # Returns None on timeout or once the buffer is closed and drained
+        with self.condition:
+            if not self.frames and not self.closed:
+                self.condition.wait(timeout)
+            if not self.frames:
+                return None
+
+            item = self.frames.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'pushed': self.pushed,
+                'dropped_oldest': self.dropped_oldest,
+                'dropped_newest': self.dropped_newest,
+                'queued': len(self.frames)
+            }
+
+
+class CaptureThread(threading.Thread):
+    # Reads the webcam as fast as it delivers frames and stamps each one at grab time,
+    # so a slow consumer never delays the capture or the recorded timestamps.
+    # Every frame is grabbed, but only frames picked by the sampler or the display sampler
+    # (or needed by the recorder) are retrieved, i.e. decoded and handed on.
+    def __init__(self, capture, buffer, clock=time.time, media_clock=None, recorder=None, timers=None,
+                 sampler=None, display_sampler=None):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.buffer = buffer
+        self.clock = clock
+        self.media_clock = media_clock
+        self.recorder = recorder
+        self.timers = timers
+        self.sampler = sampler
+        self.display_sampler = display_sampler
+        self.running = False
+        self.frames_captured = 0
+        self.frames_skipped = 0
+
+    def run(self):
+        self.running = True
+        index = 0
+        last_grab = None
+
+        while self.running:
+            if not self.capture.grab():
+                break
+            grabbed = time.perf_counter()
+            timestamp = self.clock()
+            media = self.media_clock.read() if self.media_clock else None
+            sampled = self.sampler.should_sample(timestamp) if self.sampler else True
+            displayed = self.display_sampler.should_sample(timestamp) if self.display_sampler else True
+
+            # Interval between camera frames
+            if self.timers and last_grab is not None:
+                self.timers.record('camera_interval', grabbed - last_grab)
+            last_grab = grabbed
+
+            if not (sampled or displayed or self.recorder):
+                self.frames_skipped += 1
+                index += 1
+                continue
+
+            ret, frame = self.capture.retrieve()
+            if not ret:
+                break
+
+            if self.timers:
+                # Decode cost of the retrieved frame
+                self.timers.record('capture', time.perf_counter() - grabbed)
+
+            captured = CapturedFrame(index, timestamp, frame, media, sampled, displayed)
+            if self.recorder:
+                self.recorder.submit(captured)
+            if sampled or displayed:
+                self.buffer.put(captured)
+            self.frames_captured += 1
+            index += 1
+
+        self.running = False
+        self.buffer.close()
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        self.buffer.close()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
@@ -0,0 +1,177 @@
+import collections
+import threading
+
+import cv2
+import numpy as np
+
+
+class CachedVideoCapture:
+    # Stand-in for the stimulus cv2.VideoCapture that keeps decoded, display-sized BGR frames in
+    # an LRU cache, so restarting, seeking and showing the video to the next participant cost no
+    # decode once the frames are cached. Frames live in one preallocated array of slots, in RAM
+    # or in a memory-mapped file when file_path is given; max_bytes bounds its size.
+    # display_size(frame_shape) gives the size frames are stored at; when it changes (the view was
+    # resized) the cache starts over at the new size.
+    def __init__(self, capture, display_size, max_bytes=512 * 1024 * 1024, file_path=None):
+        self.capture = capture
+        self.display_size = display_size
+        self.max_bytes = max_bytes
+        self.file_path = file_path
+        self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.lock = threading.Lock()
+
+        self.position = 0  # Next frame served by read()
+        self.decoder_position = 0  # Next frame the underlying capture will decode
+        self.size = None
+        self.storage = None
+        self.slots = collections.OrderedDict()  # frame index -> storage slot, least recent first
+        self.free_slots = []
+        self.hits = 0
+        self.misses = 0
+        self.stop_preload = False
+        self.preload_thread = None
+
+    # cv2.VideoCapture is not thread-safe: every call into the capture holds the lock, as the
+    # preload thread may be decoding
+
+    def isOpened(self):
+        with self.lock:
+            return self.capture.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        with self.lock:
+            return self.capture.get(prop)
+
+    def set(self, prop, value):
+        # Seeking only moves the read position; the decoder follows on the next cache miss
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = min(max(int(value), 0), self.frame_count)
+            return True
+        with self.lock:
+            return self.capture.set(prop, value)
+
+    def grab(self):
+        if self.position >= self.frame_count:
+            return False
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.position >= self.frame_count:
+            return False, None
+        with self.lock:
+            frame = self._frame(self.position)
+        if frame is None:
+            return False, None
+        self.position += 1
+        return True, frame
+
+    def release(self):
+        self._join_preload()
+        with self.lock:
+            self.capture.release()
+            self.slots.clear()
+            self.storage = None
+
+    def detach(self):
+        # Stops preloading and hands back the underlying capture, positioned at the next frame
+        # this cache would have served; the cache is not used afterwards
+        self._join_preload()
+        with self.lock:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, self.position)
+            self.slots.clear()
+            self.storage = None
+        return self.capture
+
+    def start_preload(self):
+        self.stop_preload = False
+        self.preload_thread = threading.Thread(target=self.preload, daemon=True)
+        self.preload_thread.start()
+
+    def _join_preload(self):
+        self.stop_preload = True
+        if self.preload_thread and self.preload_thread is not threading.current_thread():
+            self.preload_thread.join()
+        self.preload_thread = None
+
+    def preload(self):
+        # Decodes frames from the start until the cache is full; meant for a background thread
+        # between participants (start_preload). Stops early on release() or detach().
+        index = 0
+        while index < self.frame_count and not self.stop_preload:
+            with self.lock:
+                if self.storage is not None and index not in self.slots and not self.free_slots:
+                    break
+                if self._frame(index, count=False) is None:
+                    break
+            index += 1
+
+    @property
+    def cached_frames(self):
+        return len(self.slots)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _frame(self, index, count=True):
+        slot = self.slots.get(index)
+        if slot is not None and self.storage is not None:
+            self.slots.move_to_end(index)
+            if count:
+                self.hits += 1
+            return self.storage[slot]
+
+        if count:
+            self.misses += 1
+        frame = self._decode(index)
+        if frame is None:
+            return None
+
+        size = self.display_size(frame.shape)
+        if size != self.size:
+            self._allocate(size, frame.shape)
+        if not self.free_slots:
+            _, slot = self.slots.popitem(last=False)
+            self.free_slots.append(slot)
+        slot = self.free_slots.pop()
+        cv2.resize(frame, size, dst=self.storage[slot])
+        self.slots[index] = slot
+        return self.storage[slot]
+
+    def _decode(self, index):
+        # Short forward gaps are cheaper to grab through than to seek over
+        gap = index - self.decoder_position
+        if gap < 0 or gap > 30:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        else:
+            for _ in range(gap):
+                self.capture.grab()
+        self.decoder_position = index
+
+        ret, frame = self.capture.read()
+        if not ret:
+            return None
+        self.decoder_position += 1
+        return frame
+
+    def _allocate(self, size, frame_shape):
+        width, height = size
+        frame_bytes = width * height * frame_shape[2]
+        capacity = max(min(self.max_bytes // frame_bytes, self.frame_count), 1)
+        shape = (capacity, height, width, frame_shape[2])
+        if self.file_path:
+            self.storage = np.memmap(self.file_path, np.uint8, 'w+', shape=shape)
+        else:
+            self.storage = np.empty(shape, np.uint8)
+        self.size = size
+        self.slots.clear()
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+
+def format_cache_report(cache):
+    return (f"Cache stimolo: {cache.cached_frames}/{cache.frame_count} frame, "
+            f"hit {cache.hit_rate * 100:.0f}%")
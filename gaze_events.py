@@ -0,0 +1,438 @@
+"""Fixation and saccade detection over recorded or live gaze samples.
+
+    I-VT  a sample belongs to a fixation when its velocity, measured over the last
+          velocity_window seconds, is below velocity_threshold; runs of fast samples
+          are saccades
+    I-DT  a fixation is the longest window (at least min_fixation seconds) whose
+          dispersion (x range + y range) stays below dispersion_threshold
+
+The signal is gaze_x/gaze_y (stimulus pixels) for calibrated sessions, otherwise
+the midpoint between both eyes in webcam pixels (one-eye samples count as
+missing); default thresholds depend on it. Events are keyed by video_time.
+EventDetector is incremental: feed() returns the events that can no longer
+change and carries the unfinished segment over, so the same code runs over whole
+sessions, over files larger than memory chunk by chunk, and live while recording.
+
+    python gaze_events.py session.parquet --method ivt
+    python gaze_events.py session.csv --method idt --dispersion 40 --min-fixation 0.1
+"""
+import argparse
+import itertools
+import os
+import sys
+
+import numpy as np
+
+from gaze_mapping import eye_features, iter_session
+from sample_store import EYE_COLUMNS
+
+FIXATION_COLUMNS = ('start_video_time', 'end_video_time', 'duration', 'x', 'y', 'start_timestamp', 'samples')
+SACCADE_COLUMNS = ('start_video_time', 'end_video_time', 'duration', 'amplitude', 'peak_velocity',
+                   'start_timestamp')
+
+# Thresholds per signal: webcam pixels for eye positions, stimulus pixels for calibrated gaze
+# (a calibration magnifies eye movements about 40 times). They sit above the jitter of a still
+# eye, whose midpoint is quantized to 0.5 px, at any sampling rate.
+SIGNAL_DEFAULTS = {
+    'gaze': {'velocity_threshold': 2400.0, 'dispersion_threshold': 200.0},
+    'eyes': {'velocity_threshold': 60.0, 'dispersion_threshold': 5.0}
+}
+
+FIXATION, SACCADE, GAP = 0, 1, 2
+
+SEGMENT_FIELDS = ('label', 'count', 'start_t', 'start_vt', 'end_t', 'end_vt', 'sum_x', 'sum_y', 'peak',
+                  'before_t', 'before_vt', 'before_x', 'before_y', 'last_x', 'last_y')
+
+
+def event_signal(columns, signal):
+    # (x, y) arrays of the chosen signal; NaN where it is not available
+    if signal == 'gaze':
+        return np.asarray(columns['gaze_x'], np.float64), np.asarray(columns['gaze_y'], np.float64)
+    return eye_features(*(columns[name] for name in EYE_COLUMNS))
+
+
+def choose_signal(columns):
+    return 'gaze' if 'gaze_x' in columns and np.isfinite(columns['gaze_x']).any() else 'eyes'
+
+
+def empty_table(names):
+    return {name: np.empty(0, np.int64 if name == 'samples' else np.float64) for name in names}
+
+
+def _range_reduce(ufunc, values, starts, ends):
+    # ufunc.reduce over each values[start:end], for any (even overlapping) ranges
+    bounds = np.ravel([starts, ends], 'F')
+    with np.errstate(invalid='ignore'):
+        return ufunc.reduceat(np.append(values, 0.0), bounds)[::2]
+
+
+def _segment_table(t, vt, x, y, velocity, labels, starts, ends):
+    # One row per segment [start, end): what the events need, so segments that span several
+    # feed() calls can be carried over and merged without keeping their samples
+    if not len(starts):
+        return {name: np.empty(0, np.int8 if name == 'label' else np.float64) for name in SEGMENT_FIELDS}
+    labels, starts, ends = (np.asarray(values) for values in (labels, starts, ends))
+    before = np.maximum(starts - 1, 0)
+    last = ends - 1
+    return {
+        'label': labels.astype(np.int8),
+        'count': (ends - starts).astype(np.float64),
+        'start_t': t[starts], 'start_vt': vt[starts],
+        'end_t': t[last], 'end_vt': vt[last],
+        'sum_x': _range_reduce(np.add, x, starts, ends),
+        'sum_y': _range_reduce(np.add, y, starts, ends),
+        'peak': _range_reduce(np.fmax, velocity, starts, ends),
+        # A saccade runs from the last sample before it to its last sample
+        'before_t': t[before], 'before_vt': vt[before], 'before_x': x[before], 'before_y': y[before],
+        'last_x': x[last], 'last_y': y[last]
+    }
+
+
+class EventDetector:
+    # Incremental I-VT / I-DT whose results do not depend on how the samples are chunked.
+    # I-VT keeps the samples of the last velocity_window seconds and the running totals of the
+    # open segment, so its state is constant whatever the length of a fixation or of a dropout. I-DT keeps the samples of
+    # the open fixation (at most max_fixation seconds) and of the valid samples after it; data
+    # gaps are reduced to their last sample.
+    def __init__(self, method='ivt', signal='gaze', velocity_threshold=None, dispersion_threshold=None,
+                 min_fixation=0.1, max_gap=0.1, max_fixation=10.0, velocity_window=0.05):
+        if method not in ('ivt', 'idt'):
+            raise ValueError(f"Metodo non supportato: {method}")
+        defaults = SIGNAL_DEFAULTS[signal]
+        self.method = method
+        self.signal = signal
+        self.velocity_threshold = velocity_threshold or defaults['velocity_threshold']
+        self.dispersion_threshold = dispersion_threshold or defaults['dispersion_threshold']
+        self.min_fixation = min_fixation
+        self.max_gap = max_gap
+        self.max_fixation = max_fixation
+        self.velocity_window = velocity_window
+
+        self.tail = None
+        self.context = 0  # Leading tail samples that only provide the velocity of the next ones
+        self.open_segment = None  # I-VT: one-row segment table still growing
+        self.open_gap = False  # I-DT: samples since the last fixation had missing data
+        self.pending = ([], [], [], [])
+        self.fixation_count = 0
+        self.saccade_count = 0
+
+    def add_sample(self, timestamp, video_time, x, y, batch_size=10):
+        # Live use: buffers single samples and runs feed() every batch_size samples.
+        # Returns the number of fixations completed by this sample.
+        for values, value in zip(self.pending, (timestamp, video_time, x, y)):
+            values.append(value)
+        if len(self.pending[0]) < batch_size:
+            return 0
+        before = self.fixation_count
+        self.feed(*self.pending)
+        self.pending = ([], [], [], [])
+        return self.fixation_count - before
+
+    def finish(self):
+        # Closes the last segment; returns its events (and those of pending live samples)
+        events = self.feed(*self.pending, final=True)
+        self.pending = ([], [], [], [])
+        return events
+
+    def feed(self, timestamp, video_time, x, y, final=False):
+        # Returns (fixations, saccades) tables of the events completed by these samples
+        arrays = [np.asarray(values, np.float64) for values in (timestamp, video_time, x, y)]
+        if self.tail is not None:
+            arrays = [np.concatenate([kept, new]) for kept, new in zip(self.tail, arrays)]
+        t, vt, x, y = arrays
+        n = len(t)
+        first = self.context
+
+        if n == first or (first == 0 and n == 1 and not final):
+            # Nothing to label yet (the very first sample takes the label of the one after it)
+            self.tail = None if final else arrays
+            self.context = 0 if final else first
+            segments = self._close_open_segment(None, False) if final else None
+            return self._events(segments)
+
+        breaks = np.concatenate([[False], np.diff(t) > self.max_gap])
+        velocity = self._velocity(t, x, y, breaks)
+
+        if self.method == 'ivt':
+            labels, starts, ends = self._ivt_segments(velocity, breaks, first)
+            segments = _segment_table(t, vt, x, y, velocity, labels, starts, ends)
+            segments = self._continue_open_segment(segments, first > 0 and not breaks[first], final)
+            keep_from = n
+        else:
+            labels, starts, ends, keep_from = self._idt_segments(t, x, y, breaks, first, final)
+            segments = _segment_table(t, vt, x, y, velocity, labels, starts, ends)
+
+        if final:
+            self.tail = None
+            self.context = 0
+            self.open_gap = False
+        else:
+            # Besides the samples still to label, keep those the next velocities are measured from
+            reference = t[keep_from] if keep_from < n else t[-1]
+            back = int(np.searchsorted(t, reference - self.velocity_window, side='right')) - 1
+            keep = max(min(keep_from - 1, back), 0)
+            self.tail = [array[keep:] for array in arrays]
+            self.context = keep_from - keep if keep_from > 0 else 0
+        return self._events(segments)
+
+    def _velocity(self, t, x, y, breaks):
+        # Speed of each sample over the last velocity_window seconds rather than since the previous
+        # sample: the coordinates are quantized (0.5 px for the eye midpoint), and one step between
+        # two samples 8 ms apart is already 60 px/s, whatever the rate of the recording.
+        # NaN without an earlier sample, across missing samples and across time gaps.
+        n = len(t)
+        back = np.maximum(np.searchsorted(t, t - self.velocity_window, side='right') - 1, 0)
+        crossed = np.cumsum(breaks)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            velocity = np.hypot(x - x[back], y - y[back]) / (t - t[back])
+        velocity[(back == np.arange(n)) | (crossed != crossed[back])] = np.nan
+        return velocity
+
+    def _ivt_segments(self, velocity, breaks, first):
+        n = len(velocity)
+        labels = np.full(n, GAP, np.int8)
+        with np.errstate(invalid='ignore'):
+            labels[velocity < self.velocity_threshold] = FIXATION
+            labels[velocity >= self.velocity_threshold] = SACCADE
+        if first == 0 and n > 1 and not breaks[1]:
+            # The very first sample takes the label of the movement that follows it
+            labels[0] = labels[1]
+
+        change = np.flatnonzero((labels[first + 1:] != labels[first:-1]) | breaks[first + 1:]) + first + 1
+        starts = np.concatenate([[first], change]).astype(np.int64)
+        ends = np.append(starts[1:], n)
+        return labels[starts], starts, ends
+
+    def _continue_open_segment(self, segments, continues, final):
+        # The segment left open by the previous call absorbs the first new one when that has
+        # the same label and follows it without a break; the last segment stays open
+        segments = self._close_open_segment(segments, continues)
+        if final or not len(segments['label']):
+            return segments
+        self.open_segment = {name: values[-1:] for name, values in segments.items()}
+        return {name: values[:-1] for name, values in segments.items()}
+
+    def _close_open_segment(self, segments, continues):
+        open_segment, self.open_segment = self.open_segment, None
+        if open_segment is None:
+            return segments
+        if segments is None or not len(segments['label']):
+            return open_segment
+        if not continues or segments['label'][0] != open_segment['label'][0]:
+            return {name: np.concatenate([open_segment[name], segments[name]]) for name in SEGMENT_FIELDS}
+
+        merged = {name: values.copy() for name, values in segments.items()}
+        for name in ('count', 'sum_x', 'sum_y'):
+            merged[name][0] += open_segment[name][0]
+        merged['peak'][0] = np.fmax(merged['peak'][0], open_segment['peak'][0])
+        for name in ('start_t', 'start_vt', 'before_t', 'before_vt', 'before_x', 'before_y'):
+            merged[name][0] = open_segment[name][0]
+        return merged
+
+    def _idt_segments(self, t, x, y, breaks, first, final):
+        n = len(t)
+        valid = np.isfinite(x) & np.isfinite(y)
+        labels, starts, ends = [], [], []
+        span_start = i = first
+        span_gap = self.open_gap
+        # The context sample ends a fixation unless data was missing since then
+        after_fixation = first > 0 and not span_gap
+
+        while i < n:
+            if not valid[i]:
+                following = np.flatnonzero(valid[i:])
+                if not len(following):
+                    i = n
+                    break
+                i += int(following[0])
+                continue
+
+            # Smallest window covering min_fixation
+            window_end = int(np.searchsorted(t, t[i] + self.min_fixation)) + 1
+            if window_end > n:
+                break
+            if not self._window_ok(x, y, valid, breaks, i, window_end):
+                i += 1
+                continue
+
+            # Grow the window while the dispersion stays below the threshold
+            limit = min(int(np.searchsorted(t, t[i] + self.max_fixation)), n)
+            limit = max(limit, window_end)
+            xs, ys = x[i:limit], y[i:limit]
+            dispersion = (np.maximum.accumulate(xs) - np.minimum.accumulate(xs) +
+                          np.maximum.accumulate(ys) - np.minimum.accumulate(ys))
+            exceeded = ~valid[i:limit] | breaks[i:limit] | (dispersion > self.dispersion_threshold)
+            exceeded[0] = False
+            past = np.flatnonzero(exceeded[window_end - i:])
+            end = window_end + int(past[0]) if len(past) else limit
+            if end == n and not final:
+                # The fixation may continue in the next samples
+                break
+
+            if i > span_start:
+                labels.append(GAP if span_gap else self._span_label(valid, breaks, span_start, i))
+                starts.append(span_start)
+                ends.append(i)
+            elif after_fixation and not breaks[i]:
+                # Fixations often follow each other directly: the step between them is a saccade
+                labels.append(SACCADE)
+                starts.append(i)
+                ends.append(i + 1)
+            labels.append(FIXATION)
+            starts.append(i)
+            ends.append(end)
+            i = span_start = end
+            span_gap = False
+            after_fixation = True
+
+        if final:
+            if span_start < n:
+                labels.append(GAP if span_gap else self._span_label(valid, breaks, span_start, n))
+                starts.append(span_start)
+                ends.append(n)
+            keep_from = n
+        elif span_gap or (i > span_start and self._span_label(valid, breaks, span_start, i) == GAP):
+            # Missing data since the last fixation: only the samples still to scan are kept
+            span_gap = True
+            keep_from = i
+        else:
+            # The samples after the last fixation wait for the next one, which ends them
+            keep_from = span_start
+        self.open_gap = span_gap
+        return labels, starts, ends, keep_from
+
+    def _window_ok(self, x, y, valid, breaks, start, end):
+        if not valid[start:end].all() or breaks[start + 1:end].any():
+            return False
+        xs, ys = x[start:end], y[start:end]
+        return xs.max() - xs.min() + ys.max() - ys.min() <= self.dispersion_threshold
+
+    @staticmethod
+    def _span_label(valid, breaks, start, end):
+        # Samples between two fixations: a saccade unless data is missing in between
+        if valid[start:end].all() and not breaks[start + 1:end].any():
+            return SACCADE
+        return GAP
+
+    def _events(self, segments):
+        if segments is None or not len(segments['label']):
+            return empty_table(FIXATION_COLUMNS), empty_table(SACCADE_COLUMNS)
+
+        labels = segments['label']
+        durations = segments['end_t'] - segments['start_t']
+        fixation = (labels == FIXATION) & (durations >= self.min_fixation)
+        fixations = {
+            'start_video_time': segments['start_vt'][fixation],
+            'end_video_time': segments['end_vt'][fixation],
+            'duration': durations[fixation],
+            'x': segments['sum_x'][fixation] / segments['count'][fixation],
+            'y': segments['sum_y'][fixation] / segments['count'][fixation],
+            'start_timestamp': segments['start_t'][fixation],
+            'samples': segments['count'][fixation].astype(np.int64)
+        }
+
+        saccade = labels == SACCADE
+        saccades = {
+            'start_video_time': segments['before_vt'][saccade],
+            'end_video_time': segments['end_vt'][saccade],
+            'duration': segments['end_t'][saccade] - segments['before_t'][saccade],
+            'amplitude': np.hypot(segments['last_x'][saccade] - segments['before_x'][saccade],
+                                  segments['last_y'][saccade] - segments['before_y'][saccade]),
+            'peak_velocity': segments['peak'][saccade],
+            'start_timestamp': segments['before_t'][saccade]
+        }
+
+        self.fixation_count += int(fixation.sum())
+        self.saccade_count += int(saccade.sum())
+        return fixations, saccades
+
+
+def detect_events(columns, method='ivt', signal=None, **params):
+    # Whole session in memory, e.g. SampleStore.columns(); returns (fixations, saccades)
+    signal = signal or choose_signal(columns)
+    x, y = event_signal(columns, signal)
+    detector = EventDetector(method, signal, **params)
+    return detector.feed(columns['timestamp'], columns['video_time'], x, y, final=True)
+
+
+def write_event_rows(file, table, names):
+    rows = zip(*(table[name].tolist() for name in names))
+    file.write("".join(",".join(f"{value:.6f}" if isinstance(value, float) else str(value)
+                                for value in row) + "\n" for row in rows))
+
+
+def save_events(fixations, saccades, base_path):
+    # Writes <base>_fixations.csv and <base>_saccades.csv; returns their paths
+    paths = (base_path + "_fixations.csv", base_path + "_saccades.csv")
+    for path, table, names in zip(paths, (fixations, saccades), (FIXATION_COLUMNS, SACCADE_COLUMNS)):
+        with open(path, 'w') as f:
+            f.write(",".join(names) + "\n")
+            write_event_rows(f, table, names)
+    return paths
+
+
+def detect_events_file(file_path, base_path, method='ivt', signal=None, chunk_size=1_000_000, **params):
+    # Streams a session file through the detector chunk by chunk and appends the events to
+    # the output CSVs, so neither the samples nor the events have to fit in memory
+    names = ['timestamp', 'video_time'] + list(EYE_COLUMNS) + ['gaze_x', 'gaze_y']
+    chunks = iter_session(file_path, names, chunk_size)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return save_events(empty_table(FIXATION_COLUMNS), empty_table(SACCADE_COLUMNS), base_path), None
+
+    signal = signal or choose_signal(first_chunk)
+    detector = EventDetector(method, signal, **params)
+    paths = (base_path + "_fixations.csv", base_path + "_saccades.csv")
+    with open(paths[0], 'w') as fixation_file, open(paths[1], 'w') as saccade_file:
+        fixation_file.write(",".join(FIXATION_COLUMNS) + "\n")
+        saccade_file.write(",".join(SACCADE_COLUMNS) + "\n")
+
+        def write(events):
+            write_event_rows(fixation_file, events[0], FIXATION_COLUMNS)
+            write_event_rows(saccade_file, events[1], SACCADE_COLUMNS)
+
+        for chunk in itertools.chain([first_chunk], chunks):
+            x, y = event_signal(chunk, signal)
+            write(detector.feed(chunk['timestamp'], chunk['video_time'], x, y))
+        write(detector.finish())
+    return paths, detector
+
+
+def format_event_report(detector):
+    return f"Fissazioni: {detector.fixation_count} | Saccadi: {detector.saccade_count}"
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Rilevamento di fissazioni e saccadi su una sessione registrata")
+    parser.add_argument('samples', help="Campioni registrati (.csv, .parquet, .arrow, .npz)")
+    parser.add_argument('--method', choices=['ivt', 'idt'], default='ivt')
+    parser.add_argument('--signal', choices=['gaze', 'eyes'],
+                        help="Sguardo calibrato o posizione degli occhi (default: sguardo se presente)")
+    parser.add_argument('--velocity', type=float, help="Soglia di velocità I-VT (px/s)")
+    parser.add_argument('--dispersion', type=float, help="Soglia di dispersione I-DT (px)")
+    parser.add_argument('--velocity-window', type=float, default=0.05,
+                        help="Intervallo su cui è misurata la velocità I-VT (s)")
+    parser.add_argument('--min-fixation', type=float, default=0.1, help="Durata minima di una fissazione (s)")
+    parser.add_argument('--max-gap', type=float, default=0.1, help="Buco massimo tra due campioni (s)")
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help="Campioni letti per blocco")
+    parser.add_argument('-o', '--output', help="Prefisso dei file di output (default: <campioni>)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    base_path = args.output or os.path.splitext(args.samples)[0]
+
+    paths, detector = detect_events_file(args.samples, base_path, args.method, args.signal, args.chunk_size,
+                                         velocity_threshold=args.velocity,
+                                         dispersion_threshold=args.dispersion,
+                                         min_fixation=args.min_fixation, max_gap=args.max_gap,
+                                         velocity_window=args.velocity_window)
+    if detector:
+        print(format_event_report(detector))
+    print(f"Eventi salvati in: {paths[0]}, {paths[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
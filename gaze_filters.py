@@ -0,0 +1,203 @@
+"""Online smoothing of eye positions.
+
+One-Euro (adaptive low-pass: smooth at rest, responsive during fast movements)
+or constant-velocity Kalman filters, with constant state per eye and constant
+work per sample. The live tracker filters each sample before it is stored; the
+same filters run over recorded sessions, with identical results:
+
+    python gaze_filters.py session.csv --filter one_euro
+    python gaze_filters.py session.parquet --filter kalman --calibration calibration.json
+"""
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+from gaze_mapping import GazeModel, load_session, save_session
+from sample_store import EYE_COLUMNS, MISSING
+
+
+def _smoothing_factor(cutoff, dt):
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    # Casiez et al. 2012: low-pass filter whose cutoff grows with the (filtered) speed.
+    # min_cutoff (Hz) sets the smoothing at rest, beta how fast it opens up with speed (px/s).
+    def __init__(self, min_cutoff=1.0, beta=0.02, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.x = self.y = 0.0
+        self.dx = self.dy = 0.0
+
+    def __call__(self, timestamp, x, y):
+        if self.last_time is None or timestamp <= self.last_time:
+            self.last_time = timestamp
+            self.x, self.y = x, y
+            self.dx = self.dy = 0.0
+            return x, y
+
+        dt = timestamp - self.last_time
+        self.last_time = timestamp
+        a_d = _smoothing_factor(self.d_cutoff, dt)
+        self.dx += a_d * ((x - self.x) / dt - self.dx)
+        self.dy += a_d * ((y - self.y) / dt - self.dy)
+
+        a = _smoothing_factor(self.min_cutoff + self.beta * math.hypot(self.dx, self.dy), dt)
+        self.x += a * (x - self.x)
+        self.y += a * (y - self.y)
+        return self.x, self.y
+
+
+class KalmanFilter:
+    # Constant-velocity Kalman filter, one independent [position, velocity] state per axis.
+    # process_noise is the white-acceleration spectral density ((px/s^2)^2 * s),
+    # measurement_noise the variance of a detected position (px^2).
+    def __init__(self, process_noise=5000.0, measurement_noise=9.0):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        # Per axis: position, velocity, covariance p00, p01, p11
+        self.states = [None, None]
+
+    def _update(self, axis, z, dt):
+        state = self.states[axis]
+        if state is None:
+            self.states[axis] = [z, 0.0, self.measurement_noise, 0.0, 1e4]
+            return z
+        p, v, p00, p01, p11 = state
+
+        # Predict
+        q = self.process_noise
+        p += v * dt
+        p00 += dt * (2 * p01 + dt * p11) + q * dt ** 3 / 3
+        p01 += dt * p11 + q * dt ** 2 / 2
+        p11 += q * dt
+
+        # Correct
+        s = p00 + self.measurement_noise
+        k0, k1 = p00 / s, p01 / s
+        residual = z - p
+        p += k0 * residual
+        v += k1 * residual
+        p11 -= k1 * p01
+        p01 *= 1 - k0
+        p00 *= 1 - k0
+
+        self.states[axis] = [p, v, p00, p01, p11]
+        return p
+
+    def __call__(self, timestamp, x, y):
+        dt = timestamp - self.last_time if self.last_time is not None else 0.0
+        if dt <= 0:
+            self.reset()
+            dt = 0.0
+        self.last_time = timestamp
+        return self._update(0, x, dt), self._update(1, y, dt)
+
+
+FILTERS = {
+    'one_euro': OneEuroFilter,
+    'kalman': KalmanFilter
+}
+
+
+class SampleFilter:
+    # One filter per eye for the (left_x, left_y, right_x, right_y) sample records.
+    # A missing eye stays MISSING and its filter restarts when the eye has been lost for
+    # longer than max_gap seconds, so blinks and dropouts are not smoothed across.
+    def __init__(self, kind='one_euro', max_gap=0.25, **params):
+        self.kind = kind
+        self.params = params
+        self.max_gap = max_gap
+        self.filters = [FILTERS[kind](**params) for _ in range(2)]
+        self.last_seen = [None, None]
+
+    def apply(self, timestamp, left_x, left_y, right_x, right_y):
+        # Returns the filtered record as floats (MISSING kept as is)
+        record = [float(left_x), float(left_y), float(right_x), float(right_y)]
+        for eye, eye_filter in enumerate(self.filters):
+            if record[2 * eye] == MISSING:
+                continue
+            last_seen = self.last_seen[eye]
+            if last_seen is not None and timestamp - last_seen > self.max_gap:
+                eye_filter.reset()
+            self.last_seen[eye] = timestamp
+            record[2 * eye], record[2 * eye + 1] = eye_filter(timestamp, record[2 * eye], record[2 * eye + 1])
+        return tuple(record)
+
+    def describe(self):
+        return dict(self.params, kind=self.kind, max_gap=self.max_gap)
+
+
+def filter_columns(columns, kind='one_euro', model=None, max_gap=0.25, **params):
+    # Recorded sessions. This is a plain per-sample Python loop over SampleFilter.apply, not a
+    # vectorized transform: One-Euro adapts its cutoff to the speed and both filters restart on
+    # dropouts, so each output depends on the previous one. Running the live code keeps the
+    # values identical to what the tracker stores, at ~5 µs per sample (an hour at
+    # 120 Hz takes a few seconds). With a GazeModel the gaze is recomputed from the unrounded
+    # filtered positions.
+    sample_filter = SampleFilter(kind, max_gap, **params)
+    eye_lists = [np.asarray(columns[name], np.float64).tolist() for name in EYE_COLUMNS]
+    filtered = np.array([sample_filter.apply(t, *eyes)
+                         for t, *eyes in zip(np.asarray(columns['timestamp']).tolist(), *eye_lists)],
+                        np.float64).reshape(-1, 4)
+
+    result = dict(columns)
+    if model is not None:
+        gaze_x, gaze_y = model.map_eyes(*filtered.T)
+        result['gaze_x'] = gaze_x.astype(np.float32)
+        result['gaze_y'] = gaze_y.astype(np.float32)
+    for i, name in enumerate(EYE_COLUMNS):
+        result[name] = np.rint(filtered[:, i]).astype(np.int32)
+    return result
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Filtraggio temporale delle posizioni degli occhi registrate")
+    parser.add_argument('samples', help="Campioni registrati (.csv, .parquet, .arrow, .npz)")
+    parser.add_argument('--filter', choices=sorted(FILTERS), default='one_euro')
+    parser.add_argument('--calibration', help="Calibrazione (.json) per ricalcolare lo sguardo")
+    parser.add_argument('--max-gap', type=float, default=0.25,
+                        help="Secondi senza occhio dopo i quali il filtro riparte")
+    parser.add_argument('-o', '--output', help="File di output (default: <campioni>_<filtro>.<estensione>)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    base, extension = os.path.splitext(args.samples)
+    output = args.output or f"{base}_{args.filter}{extension}"
+
+    columns, metadata = load_session(args.samples)
+    # Exported sessions carry the calibration they were recorded with
+    model = None
+    if args.calibration:
+        model = GazeModel.load(args.calibration)
+    elif metadata.get('calibration'):
+        model = GazeModel.from_dict(metadata['calibration'])
+    columns.setdefault('gaze_x', np.full(len(columns['timestamp']), np.nan, np.float32))
+    columns.setdefault('gaze_y', np.full(len(columns['timestamp']), np.nan, np.float32))
+    columns = filter_columns(columns, args.filter, model, args.max_gap)
+    metadata['filter'] = {'kind': args.filter, 'max_gap': args.max_gap}
+    if model:
+        metadata['calibration'] = model.to_dict()
+
+    save_session(columns, output, metadata)
+    print(f"{len(columns['timestamp'])} campioni filtrati ({args.filter}) salvati in: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Mapping of eye positions to gaze points on the stimulus video.
+
+A calibration shows targets at known stimulus positions and records the eye
+positions while the participant looks at them; a polynomial regression fitted
+by least squares then maps eye positions to stimulus pixels. The mapping is a
+batch transform over column arrays, so recorded sessions can be (re)mapped
+offline with any calibration:
+
+    python gaze_mapping.py session.parquet calibration.json -o session_gaze.parquet
+    python gaze_mapping.py session.csv calibration.json
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+from sample_export import export_samples, iter_columns, load_columns
+from sample_store import EYE_COLUMNS, MISSING, SAMPLE_DTYPES, SampleStore
+from tracking_engine import write_samples_csv
+
+# Normalized stimulus positions of the calibration targets (3 x 3 grid, centre first)
+CALIBRATION_TARGETS = ((0.5, 0.5), (0.1, 0.1), (0.5, 0.1), (0.9, 0.1), (0.1, 0.5),
+                       (0.9, 0.5), (0.1, 0.9), (0.5, 0.9), (0.9, 0.9))
+
+
+def eye_features(left_x, left_y, right_x, right_y, eye_offset=None):
+    # Midpoint between the eyes of each sample. The mean of a single eye would sit half the
+    # inter-ocular distance away from it, far outside the range the pupils cover: with only one
+    # eye the midpoint is rebuilt from eye_offset (right - left, see measure_eye_offset), and is
+    # NaN without it or when no eye was found.
+    left_x, left_y, right_x, right_y = (np.asarray(value, np.float64)
+                                        for value in (left_x, left_y, right_x, right_y))
+    has_left = left_x != MISSING
+    has_right = right_x != MISSING
+    x = np.where(has_left & has_right, (left_x + right_x) / 2, np.nan)
+    y = np.where(has_left & has_right, (left_y + right_y) / 2, np.nan)
+    if eye_offset is not None:
+        half_x, half_y = eye_offset[0] / 2, eye_offset[1] / 2
+        x = np.where(has_left & ~has_right, left_x + half_x, np.where(~has_left & has_right, right_x - half_x, x))
+        y = np.where(has_left & ~has_right, left_y + half_y, np.where(~has_left & has_right, right_y - half_y, y))
+    return x, y
+
+
+def measure_eye_offset(left_x, left_y, right_x, right_y):
+    # Median (right - left) position over the samples with both eyes; None if there are none
+    left_x, left_y, right_x, right_y = (np.asarray(value, np.float64)
+                                        for value in (left_x, left_y, right_x, right_y))
+    both = (left_x != MISSING) & (right_x != MISSING)
+    if not both.any():
+        return None
+    return float(np.median(right_x[both] - left_x[both])), float(np.median(right_y[both] - left_y[both]))
+
+
+def polynomial_terms(x, y, degree=2):
+    # Design matrix with every monomial x^i * y^j, i + j <= degree (constant term first)
+    return np.stack([x ** (total - j) * y ** j for total in range(degree + 1) for j in range(total + 1)], axis=-1)
+
+
+class GazeModel:
+    # Polynomial regression from eye features to stimulus pixels. Features are centred and
+    # scaled with the calibration statistics to keep the least-squares problem well conditioned.
+    # eye_offset, measured during the calibration, lets one-eye samples be mapped as well.
+    def __init__(self, coefficients, degree, mean, scale, stimulus_size, rms_error=None, eye_offset=None):
+        self.coefficients = np.asarray(coefficients, np.float64)
+        self.degree = degree
+        self.mean = np.asarray(mean, np.float64)
+        self.scale = np.asarray(scale, np.float64)
+        self.stimulus_size = tuple(stimulus_size)
+        self.rms_error = rms_error
+        self.eye_offset = tuple(eye_offset) if eye_offset is not None else None
+
+    @classmethod
+    def fit(cls, features_x, features_y, targets_x, targets_y, stimulus_size, degree=2, eye_offset=None):
+        features = np.column_stack([features_x, features_y]).astype(np.float64)
+        targets = np.column_stack([targets_x, targets_y]).astype(np.float64)
+        usable = np.isfinite(features).all(axis=1)
+        features, targets = features[usable], targets[usable]
+
+        # A full polynomial needs as many targets as terms, fall back to a lower degree
+        while degree > 1 and len(features) < (degree + 1) * (degree + 2) // 2:
+            degree -= 1
+        if len(features) < 3:
+            raise ValueError("Calibrazione insufficiente: servono almeno 3 punti con gli occhi rilevati")
+
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        normalized = (features - mean) / scale
+        design = polynomial_terms(normalized[:, 0], normalized[:, 1], degree)
+        coefficients, *_ = np.linalg.lstsq(design, targets, rcond=None)
+
+        residuals = design @ coefficients - targets
+        rms_error = float(np.sqrt((residuals ** 2).sum(axis=1).mean()))
+        return cls(coefficients, degree, mean, scale, stimulus_size, rms_error, eye_offset)
+
+    def predict(self, features_x, features_y):
+        # Vectorized over any number of samples; NaN features give NaN gaze
+        x = (np.asarray(features_x, np.float64) - self.mean[0]) / self.scale[0]
+        y = (np.asarray(features_y, np.float64) - self.mean[1]) / self.scale[1]
+        gaze = polynomial_terms(x, y, self.degree) @ self.coefficients
+        return gaze[..., 0], gaze[..., 1]
+
+    def map_eyes(self, left_x, left_y, right_x, right_y):
+        return self.predict(*eye_features(left_x, left_y, right_x, right_y, self.eye_offset))
+
+    def map_sample(self, left_x, left_y, right_x, right_y):
+        # Single live sample, as plain floats
+        gaze_x, gaze_y = self.map_eyes(left_x, left_y, right_x, right_y)
+        return float(gaze_x), float(gaze_y)
+
+    def to_dict(self):
+        return {
+            'degree': self.degree,
+            'coefficients': self.coefficients.tolist(),
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'stimulus_size': list(self.stimulus_size),
+            'rms_error': self.rms_error,
+            'eye_offset': list(self.eye_offset) if self.eye_offset is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['coefficients'], data['degree'], data['mean'], data['scale'],
+                   data['stimulus_size'], data.get('rms_error'), data.get('eye_offset'))
+
+    def save(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def map_session(columns, model):
+    # Adds gaze_x / gaze_y (stimulus pixels) to a dict of sample columns, in place
+    gaze_x, gaze_y = model.map_eyes(*(columns[name] for name in EYE_COLUMNS))
+    columns['gaze_x'] = gaze_x.astype(np.float32)
+    columns['gaze_y'] = gaze_y.astype(np.float32)
+    return columns
+
+
+def load_session(file_path):
+    # Sample columns of a CSV log or of an exported file (eye columns and timing only)
+    names = [name for name, _ in SAMPLE_DTYPES if not name.startswith('gaze_')]
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        table = np.genfromtxt(file_path, delimiter=',', names=True, ndmin=1)
+        return {name: table[name] for name in names}, {}
+    return load_columns(file_path, names)
+
+
+def iter_session(file_path, names, chunk_size=1_000_000):
+    # Chunked counterpart of load_session, for sessions larger than memory
+    if os.path.splitext(file_path)[1].lower() != '.csv':
+        yield from iter_columns(file_path, names, chunk_size)
+        return
+
+    with open(file_path) as f:
+        header = f.readline().strip().split(',')
+        indices = [header.index(name) for name in names]
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            table = np.loadtxt(lines, delimiter=',', usecols=indices, ndmin=2)
+            yield {name: table[:, i] for i, name in enumerate(names)}
+
+
+def save_session(columns, file_path, metadata=None):
+    # CSV (metadata is dropped) or any of the export formats
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        store = SampleStore(len(columns['timestamp']) or 1)
+        store.extend_columns(**columns)
+        write_samples_csv(store, file_path)
+    else:
+        export_samples(columns, file_path, metadata)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Calcolo dello sguardo sul video stimolo da una calibrazione")
+    parser.add_argument('samples', help="Campioni registrati (.csv, .parquet, .arrow, .npz)")
+    parser.add_argument('calibration', help="File di calibrazione (.json) salvato dal player")
+    parser.add_argument('-o', '--output', help="File di output (default: <campioni>_gaze.<estensione>)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    base, extension = os.path.splitext(args.samples)
+    output = args.output or base + '_gaze' + extension
+
+    model = GazeModel.load(args.calibration)
+    columns, metadata = load_session(args.samples)
+    map_session(columns, model)
+    metadata['calibration'] = model.to_dict()
+
+    save_session(columns, output, metadata)
+
+    print(f"Sguardo calcolato per {len(columns['timestamp'])} campioni, salvato in: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class RollingHistogram:
+    # Keeps the last `capacity` durations in a ring buffer: O(1) record, percentiles on demand
+    def __init__(self, capacity=512):
+        self.values = np.zeros(capacity, np.float64)
+        self.count = 0
+        self.total_count = 0
+        self.total_time = 0.0
+        self.max_value = 0.0
+
+    def record(self, seconds):
+        self.values[self.total_count % len(self.values)] = seconds
+        self.total_count += 1
+        self.count = min(self.count + 1, len(self.values))
+        self.total_time += seconds
+        if seconds > self.max_value:
+            self.max_value = seconds
+
+    def summary(self):
+        if not self.count:
+            return None
+        window = self.values[:self.count] * 1000
+        p50, p95, p99 = np.percentile(window, (50, 95, 99))
+        return {
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'mean_ms': self.total_time / self.total_count * 1000,
+            'max_ms': self.max_value * 1000,
+            'count': self.total_count
+        }
+
+
+class StageTimers:
+    # One rolling histogram per pipeline stage, shared by the capture, tracking and Tk threads
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def record(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = RollingHistogram(self.capacity)
+            histogram.record(seconds)
+
+    def time(self, stage):
+        return _StageTimer(self, stage)
+
+    def snapshot(self):
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def p95_ms(self, stage):
+        summary = self.snapshot().get(stage)
+        return summary['p95_ms'] if summary else None
+
+    def dump(self, file_path, extra=None):
+        stats = {'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'stages': self.snapshot()}
+        if extra:
+            stats.update(extra)
+        with open(file_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+
+
+class _StageTimer:
+    def __init__(self, timers, stage):
+        self.timers = timers
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timers.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def format_stage_line(snapshot, stages, labels):
+    parts = []
+    for stage, label in zip(stages, labels):
+        summary = snapshot.get(stage)
+        if summary:
+            parts.append(f"{label} {summary['p50_ms']:.1f}/{summary['p95_ms']:.1f} ms")
+    return " | ".join(parts)
@@ -7,6 +7,9 @@ import time
 import os
 from PIL import Image, ImageTk
 
+from sample_store import MISSING
+from tracking_engine import EyeTracker, draw_detections, eye_sample
+
 
 class EyeTrackingVideoPlayer:
     def __init__(self, root):
@@ -54,8 +57,7 @@ class EyeTrackingVideoPlayer:
         self.recording = False
 
         # Eye detection setup
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+        self.tracker = EyeTracker()
 
         # Create UI
         self.create_ui()
@@ -261,11 +263,11 @@ class EyeTrackingVideoPlayer:
             if not ret:
                 break
 
-            # Process frame for eye detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            # Detect faces
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+            # Detect faces and eyes
+            detections = self.tracker.detect(frame)
+            # Pupil centres are located before the boxes are drawn over the frame
+            eyes = eye_sample(detections, frame)
+            draw_detections(frame, detections, [(x, y) for x, y in (eyes[:2], eyes[2:]) if x != MISSING])
 
             # Get current video time
             if self.video_player:
@@ -273,37 +275,18 @@ class EyeTrackingVideoPlayer:
             else:
                 video_time = 0
 
-            # Process each face
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-
-                # Region of interest for the face
-                roi_gray = gray[y:y + h, x:x + w]
-                roi_color = frame[y:y + h, x:x + w]
-
-                # Detect eyes
-                eyes = self.eye_cascade.detectMultiScale(roi_gray)
-
-                eye_count += len(eyes)
-
-                for (ex, ey, ew, eh) in eyes:
-                    # Draw rectangle around the eyes
-                    cv2.rectangle(roi_color, (ex, ey), (ex + ew, ey + eh), (0, 255, 0), 2)
-
-                    # Calculate center of the eye
-                    eye_center_x = x + ex + ew // 2
-                    eye_center_y = y + ey + eh // 2
-
-                    # Draw center point
-                    cv2.circle(frame, (eye_center_x, eye_center_y), 2, (0, 0, 255), 2)
+            eye_count += sum(1 for value in (eyes[0], eyes[2]) if value != MISSING)
 
-                    # Save eye coordinates with timestamp and video time
-                    self.eye_coords.append({
-                        'timestamp': time.time(),
-                        'video_time': video_time,
-                        'eye_x': eye_center_x,
-                        'eye_y': eye_center_y
-                    })
+            # One record per sample, left and right eye in fixed columns (MISSING if not found)
+            left_x, left_y, right_x, right_y = eyes
+            self.eye_coords.append({
+                'timestamp': time.time(),
+                'video_time': video_time,
+                'left_x': left_x,
+                'left_y': left_y,
+                'right_x': right_x,
+                'right_y': right_y
+            })
 
             # Update metrics
             self.metrics_label.config(text=f"Punti tracciati: {len(self.eye_coords)} | Occhi rilevati: {eye_count}")
@@ -332,9 +315,10 @@ class EyeTrackingVideoPlayer:
 
         if file_path:
             with open(file_path, 'w') as f:
-                f.write("timestamp,video_time,eye_x,eye_y\n")
+                f.write("timestamp,video_time,left_x,left_y,right_x,right_y\n")
                 for coord in self.eye_coords:
-                    f.write(f"{coord['timestamp']},{coord['video_time']},{coord['eye_x']},{coord['eye_y']}\n")
+                    f.write(f"{coord['timestamp']},{coord['video_time']},"
+                            f"{coord['left_x']},{coord['left_y']},{coord['right_x']},{coord['right_y']}\n")
 
             self.status_label.config(text=f"✅ Dati salvati in: {file_path}")
 
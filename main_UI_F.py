@@ -5,7 +5,24 @@ import numpy as np
 import threading
 import time
 import os
-from PIL import Image, ImageTk
+import shutil
+
+from capture_pipeline import BLOCK, DROP_OLDEST, CaptureThread, FrameRingBuffer
+from frame_cache import CachedVideoCapture, format_cache_report
+from gaze_events import EventDetector, detect_events, save_events
+from gaze_filters import SampleFilter
+from gaze_mapping import CALIBRATION_TARGETS, GazeModel, eye_features, measure_eye_offset
+from instrumentation import StageTimers, format_stage_line
+from playback import MediaClock, PlaybackScheduler, format_playback_report
+from rate_sampler import RateSampler, format_rate_report, negotiate_camera_fps
+from replay_source import ReplayCapture
+from sample_export import EXPORT_FORMATS, export_samples
+from sample_store import MISSING, SampleStore
+from sample_writer import StreamingSampleWriter
+from tracking_engine import (EyeTracker, draw_detections, eye_sample, format_latency_report, scale_detections,
+                             write_samples_csv)
+from ui_bridge import DisplayBuffers, LatestValue, PhotoSurface, RenderScheduler, fit_size
+from webcam_recorder import WebcamRecorder, index_path_for
 
 
 class EyeTrackingVideoPlayer:
@@ -50,17 +67,88 @@ class EyeTrackingVideoPlayer:
         self.video_player = None
         self.webcam = None
         self.is_playing = False
-        self.eye_coords = []
+        self.eye_coords = SampleStore()
         self.recording = False
         self.sampling_rate = 0.033  # Default: ~30 Hz (ogni 33ms)
-        self.last_sample_time = 0
+        self.sampler = None
+        # Webcam preview rate, Hz: frames neither sampled nor previewed are never decoded. Below the
+        # camera fps by default; at or above it every frame is previewed and nothing is skipped.
+        self.display_rate = 15
+
+        # Webcam capture runs on its own thread and feeds a bounded frame buffer
+        self.frame_buffer = None
+        self.capture_thread = None
+        self.frame_buffer_size = 4
+        self.frame_drop_policy = DROP_OLDEST  # DROP_OLDEST, DROP_NEWEST or BLOCK
+        self.playback = None
+        self.playback_thread = None
+        self.tracking_thread = None
+        self.media_clock = MediaClock()
+
+        # Decoded, display-sized stimulus frames kept across sessions (RAM, or a memory-mapped
+        # file in the session folder when stimulus_cache_on_disk is set)
+        self.stimulus_cache = None
+        self.stimulus_cache_bytes = 512 * 1024 * 1024
+        self.stimulus_cache_on_disk = False
+
+        # Samples are streamed to a log on disk while recording
+        self.session_log_dir = os.path.join(os.path.expanduser("~"), "eye_tracking_sessions")
+        self.sample_writer = None
+        self.session_metadata = {}
+        self.webcam_recorder = None
+
+        # Always-on per-stage latency histograms
+        self.stage_timers = StageTimers()
+        self.session_name = None
+
+        # Recorded webcam file to replay instead of the live camera (None = webcam 0)
+        self.replay_path = None
+
+        # Calibration: eye positions -> stimulus pixels (None until a calibration succeeds)
+        self.gaze_model = None
+        self.calibrating = False
+        self.calibration_settle = 0.8  # Seconds before samples are collected on a target
+        self.calibration_dwell = 1.2  # Seconds of samples per target
+
+        # Online smoothing of the eye positions before they are stored (None = raw)
+        self.sample_filter = None
+        self.filter_kinds = {"Nessuno": None, "One-Euro": 'one_euro', "Kalman": 'kalman'}
+
+        # Fixation/saccade detection, live during the session and over the saved samples
+        self.event_method = 'ivt'
+        self.event_detector = None
 
         # Eye detection setup
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+        self.tracker = EyeTracker()
+        self.roi_keyframe_interval = 10
+
+        # Display frames are built in reusable buffers, fitted to the labels' current size,
+        # and pasted into persistent PhotoImages (initial boxes until the labels are laid out)
+        self.video_display = DisplayBuffers((800, 450))
+        self.webcam_display = DisplayBuffers((400, 300))
 
         # Create UI
         self.create_ui()
+        self.video_surface = PhotoSurface(self.video_label, self.video_display)
+        self.webcam_surface = PhotoSurface(self.webcam_label, self.webcam_display)
+
+        # Worker threads publish into these slots, only the render scheduler touches Tk
+        self.video_frame_slot = LatestValue()
+        self.video_progress_slot = LatestValue()
+        self.video_ended_slot = LatestValue()
+        self.webcam_frame_slot = LatestValue()
+        self.tracking_metrics_slot = LatestValue()
+        self.calibration_slot = LatestValue()
+
+        self.render_scheduler = RenderScheduler(self.root)
+        self.render_scheduler.add(self.video_frame_slot, self.show_video_frame)
+        self.render_scheduler.add(self.video_progress_slot, self.show_video_progress)
+        self.render_scheduler.add(self.video_ended_slot, lambda _: self.stop_combined())
+        self.render_scheduler.add(self.webcam_frame_slot, self.show_webcam_frame)
+        self.render_scheduler.add(self.tracking_metrics_slot, self.show_tracking_metrics)
+        self.render_scheduler.add(self.calibration_slot, self.finish_calibration)
+        self.render_scheduler.start()
+        self.update_latency_panel()
 
     def create_ui(self):
         # Title
@@ -105,6 +193,12 @@ class EyeTrackingVideoPlayer:
         self.save_btn = ttk.Button(button_frame, text="💾 Salva Dati", command=self.save_eye_data, state=tk.DISABLED)
         self.save_btn.pack(side=tk.LEFT, padx=5)
 
+        self.replay_btn = ttk.Button(button_frame, text="🎞️ Replay Webcam", command=self.select_replay)
+        self.replay_btn.pack(side=tk.LEFT, padx=5)
+
+        self.calibrate_btn = ttk.Button(button_frame, text="🎯 Calibra", command=self.start_calibration)
+        self.calibrate_btn.pack(side=tk.LEFT, padx=5)
+
         # Sampling rate control
         sampling_frame = ttk.Frame(control_frame, style='TFrame')
         sampling_frame.pack(fill=tk.X, pady=(10, 0))
@@ -127,6 +221,41 @@ class EyeTrackingVideoPlayer:
         ttk.Radiobutton(rb_frame, text="120 Hz", variable=self.sampling_var,
                         value="120", command=self.update_sampling_rate).pack(side=tk.LEFT, padx=5)
 
+        # Face-ROI mode: full-frame face search only on keyframes
+        self.roi_mode_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sampling_frame, text="Modalità ROI volto", variable=self.roi_mode_var,
+                        command=self.update_roi_mode).pack(side=tk.LEFT, padx=(20, 5))
+
+        # Archive the raw webcam stream next to the samples
+        self.record_webcam_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sampling_frame, text="Registra webcam",
+                        variable=self.record_webcam_var).pack(side=tk.LEFT, padx=5)
+
+        # Keep the decoded stimulus in memory for instant restarts
+        self.cache_stimulus_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sampling_frame, text="Cache stimolo", variable=self.cache_stimulus_var,
+                        command=self.update_stimulus_cache).pack(side=tk.LEFT, padx=5)
+
+        # Resolution of the face search (eyes are always searched at full resolution)
+        ttk.Label(sampling_frame, text="Rilevamento volto:", style='TLabel').pack(side=tk.LEFT, padx=(20, 5))
+        self.detection_scale_var = tk.StringVar(value="100%")
+        detection_scale_box = ttk.Combobox(sampling_frame, textvariable=self.detection_scale_var,
+                                           values=["100%", "50%", "25%"], width=6, state='readonly')
+        detection_scale_box.bind("<<ComboboxSelected>>", self.update_detection_scale)
+        detection_scale_box.pack(side=tk.LEFT)
+
+        # Webcam preview refresh, independent of the sampling rate
+        ttk.Label(sampling_frame, text="Anteprima webcam:", style='TLabel').pack(side=tk.LEFT, padx=(20, 5))
+        self.display_rate_var = tk.StringVar(value=f"{self.display_rate} Hz")
+        ttk.Combobox(sampling_frame, textvariable=self.display_rate_var, values=["5 Hz", "15 Hz", "30 Hz", "60 Hz"],
+                     width=6, state='readonly').pack(side=tk.LEFT)
+
+        # Temporal filter applied to every sample while recording
+        ttk.Label(sampling_frame, text="Filtro:", style='TLabel').pack(side=tk.LEFT, padx=(20, 5))
+        self.filter_var = tk.StringVar(value="Nessuno")
+        ttk.Combobox(sampling_frame, textvariable=self.filter_var, values=["Nessuno", "One-Euro", "Kalman"],
+                     width=9, state='readonly').pack(side=tk.LEFT)
+
         self.actual_rate_label = ttk.Label(sampling_frame,
                                            text="Campioni effettivi: 0 Hz",
                                            style='TLabel')
@@ -156,10 +285,15 @@ class EyeTrackingVideoPlayer:
         metrics_frame.pack(fill=tk.X, pady=(10, 0))
 
         self.metrics_label = ttk.Label(metrics_frame,
-                                       text="Punti tracciati: 0 | Occhi rilevati: 0",
+                                       text="Campioni: 0 | Occhi rilevati: 0",
                                        style='Status.TLabel')
         self.metrics_label.pack(fill=tk.X)
 
+        self.latency_label = ttk.Label(metrics_frame,
+                                       text="Latenze p50/p95: -",
+                                       style='Status.TLabel')
+        self.latency_label.pack(fill=tk.X, pady=(2, 0))
+
         # Status bar
         self.status_label = ttk.Label(self.root,
                                       text="Seleziona un video per iniziare",
@@ -172,6 +306,37 @@ class EyeTrackingVideoPlayer:
         self.status_label.config(
             text=f"Frequenza di campionamento impostata a {rate} Hz (ogni {int(self.sampling_rate * 1000)} ms)")
 
+    def update_roi_mode(self):
+        if self.roi_mode_var.get():
+            self.tracker.keyframe_interval = self.roi_keyframe_interval
+            self.status_label.config(
+                text=f"Modalità ROI volto attiva (ricerca completa ogni {self.roi_keyframe_interval} campioni)")
+        else:
+            self.tracker.keyframe_interval = 0
+            self.status_label.config(text="Modalità ROI volto disattivata")
+
+    def update_detection_scale(self, event=None):
+        percent = int(self.detection_scale_var.get().rstrip('%'))
+        self.tracker.detection_scale = percent / 100.0
+        self.tracker.reset_tracking()
+        self.status_label.config(text=f"Ricerca del volto al {percent}% della risoluzione webcam")
+
+    def select_replay(self):
+        replay_path = filedialog.askopenfilename(
+            title="Seleziona una registrazione webcam",
+            filetypes=[("Video files", "*.avi *.mp4 *.mkv"), ("All files", "*.*")]
+        )
+
+        if not replay_path:
+            self.replay_path = None
+            self.status_label.config(text="Sorgente: webcam")
+        elif not os.path.exists(index_path_for(replay_path)):
+            self.replay_path = None
+            self.status_label.config(text=f"⚠️ Indice dei frame mancante: {index_path_for(replay_path)}")
+        else:
+            self.replay_path = replay_path
+            self.status_label.config(text=f"Sorgente: replay di {os.path.basename(replay_path)}")
+
     def select_video(self):
         self.video_path = filedialog.askopenfilename(
             title="Seleziona un video",
@@ -184,6 +349,11 @@ class EyeTrackingVideoPlayer:
             self.start_btn.config(state=tk.NORMAL)
 
             # Initialize video capture
+            if self.stimulus_cache:
+                self.stimulus_cache.release()
+                self.stimulus_cache = None
+            elif self.video_player:
+                self.video_player.release()
             self.video_player = cv2.VideoCapture(self.video_path)
 
             # Get video duration
@@ -193,42 +363,209 @@ class EyeTrackingVideoPlayer:
             mins, secs = divmod(duration, 60)
             self.time_label.config(text=f"00:00 / {int(mins):02d}:{int(secs):02d}")
 
-            # Read first frame to display
-            ret, frame = self.video_player.read()
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame = cv2.resize(frame, (800, 450))
-                photo = ImageTk.PhotoImage(image=Image.fromarray(frame))
-                self.video_label.config(image=photo)
-                self.video_label.image = photo
+            self.show_first_frame()
+            self.update_stimulus_cache()
+
+    def show_first_frame(self):
+        # Shows the first stimulus frame and rewinds, so playback starts at frame 0
+        ret, frame = self.video_player.read()
+        if ret:
+            self.video_surface.show(self.video_display.render(frame))
+        self.video_player.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def update_stimulus_cache(self):
+        # Applied when no video is playing (start_combined applies a change made during playback)
+        if not self.video_player or self.is_playing:
+            return
+
+        if self.cache_stimulus_var.get() and not self.stimulus_cache:
+            cache_path = None
+            if self.stimulus_cache_on_disk:
+                os.makedirs(self.session_log_dir, exist_ok=True)
+                cache_path = os.path.join(self.session_log_dir, "stimulus_cache.dat")
+            self.stimulus_cache = CachedVideoCapture(
+                self.video_player, lambda shape: fit_size(shape, self.video_display.request[0]),
+                self.stimulus_cache_bytes, cache_path)
+            self.video_player = self.stimulus_cache
+            # Fill the cache in the background so even the first session plays from memory
+            self.stimulus_cache.start_preload()
+        elif not self.cache_stimulus_var.get() and self.stimulus_cache:
+            # The preload thread is joined before the capture is used again from this thread
+            self.video_player = self.stimulus_cache.detach()
+            self.stimulus_cache = None
+
+    def start_calibration(self):
+        if self.is_playing or self.recording or self.calibrating:
+            return
+        if not self.video_player:
+            self.status_label.config(text="⚠️ Seleziona prima il video stimolo")
+            return
+
+        self.calibrating = True
+        stimulus_size = (int(self.video_player.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         int(self.video_player.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.start_btn.config(state=tk.DISABLED)
+        self.calibrate_btn.config(state=tk.DISABLED)
+        self.status_label.config(text="🎯 Calibrazione: fissa i punti che compaiono sul video")
+        threading.Thread(target=self.run_calibration, args=(stimulus_size,), daemon=True).start()
+
+    def run_calibration(self, stimulus_size):
+        # Shows each target over the video area, in stimulus coordinates, and records the median
+        # midpoint of the eyes while it is fixated (samples with both eyes only); the inter-ocular
+        # offset measured over all targets maps one-eye samples later. Publishes (model, error).
+        width, height = stimulus_size
+        radius = max(max(width, height) // 80, 4)
+        webcam = cv2.VideoCapture(0)
+        self.tracker.reset_tracking()
+        features_x, features_y, targets_x, targets_y = [], [], [], []
+        eyes_seen = []
+        try:
+            for u, v in CALIBRATION_TARGETS:
+                target = (int(u * width), int(v * height))
+                canvas = np.zeros((height, width, 3), np.uint8)
+                cv2.circle(canvas, target, radius, (255, 255, 255), -1)
+                cv2.circle(canvas, target, max(radius // 3, 1), (0, 0, 255), -1)
+                self.video_frame_slot.set(self.video_display.render(canvas))
+
+                xs, ys = [], []
+                shown_at = time.perf_counter()
+                while time.perf_counter() - shown_at < self.calibration_settle + self.calibration_dwell:
+                    ret, frame = webcam.read()
+                    if not ret:
+                        raise IOError("Webcam non disponibile")
+                    if time.perf_counter() - shown_at < self.calibration_settle:
+                        continue
+                    eyes = eye_sample(self.tracker.detect(frame), frame)
+                    eyes_seen.append(eyes)
+                    x, y = eye_features(*eyes)
+                    if np.isfinite(x):
+                        xs.append(float(x))
+                        ys.append(float(y))
+
+                if xs:
+                    features_x.append(np.median(xs))
+                    features_y.append(np.median(ys))
+                    targets_x.append(target[0])
+                    targets_y.append(target[1])
+
+            eye_offset = measure_eye_offset(*zip(*eyes_seen)) if eyes_seen else None
+            model = GazeModel.fit(features_x, features_y, targets_x, targets_y, stimulus_size,
+                                  eye_offset=eye_offset)
+            self.calibration_slot.set((model, None))
+        except (IOError, ValueError) as e:
+            self.calibration_slot.set((None, str(e)))
+        finally:
+            webcam.release()
+
+    def finish_calibration(self, result):
+        model, error = result
+        self.calibrating = False
+        self.calibrate_btn.config(state=tk.NORMAL)
+        if self.video_player:
+            self.start_btn.config(state=tk.NORMAL)
+            self.show_first_frame()
+        if model is None:
+            self.status_label.config(text=f"❌ Calibrazione fallita: {error}")
+            return
+
+        self.gaze_model = model
+        os.makedirs(self.session_log_dir, exist_ok=True)
+        calibration_path = os.path.join(self.session_log_dir, time.strftime("calibration_%Y%m%d_%H%M%S.json"))
+        model.save(calibration_path)
+        self.status_label.config(text=f"✅ Calibrazione completata: errore medio {model.rms_error:.0f} px "
+                                      f"sul video | Salvata in: {calibration_path}")
 
     def start_combined(self):
         # Start both video playback and eye tracking
-        if not self.is_playing and not self.recording:
-            # Start video
+        if not self.is_playing and not self.recording and not self.calibrating:
+            # Start video; every session shows the stimulus from its first frame
+            self.update_stimulus_cache()
+            self.video_player.set(cv2.CAP_PROP_POS_FRAMES, 0)
             self.is_playing = True
 
             # Start webcam and eye tracking
             self.recording = True
-            self.eye_coords = []  # Reset coordinates
-            self.webcam = cv2.VideoCapture(0)  # Open default webcam
+            self.eye_coords = SampleStore()  # Reset coordinates
+            os.makedirs(self.session_log_dir, exist_ok=True)
+            session_name = time.strftime("session_%Y%m%d_%H%M%S")
+            self.session_name = session_name
+            self.stage_timers = StageTimers()
+            self.sample_writer = StreamingSampleWriter(os.path.join(self.session_log_dir, session_name + ".csv"))
+            if self.replay_path:
+                # Replay keeps every recorded frame so the session is reproduced exactly
+                self.webcam = ReplayCapture(self.replay_path, realtime=True)
+                self.frame_buffer = FrameRingBuffer(self.frame_buffer_size, BLOCK)
+            else:
+                self.webcam = cv2.VideoCapture(0)  # Open default webcam
+                self.frame_buffer = FrameRingBuffer(self.frame_buffer_size, self.frame_drop_policy)
+            self.session_metadata = {
+                'video_path': self.video_path,
+                'video_fps': self.video_player.get(cv2.CAP_PROP_FPS) if self.video_player else None,
+                'sampling_rate_hz': round(1.0 / self.sampling_rate, 3),
+                'webcam_width': int(self.webcam.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'webcam_height': int(self.webcam.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'start_time': time.time(),
+                'calibration': self.gaze_model.to_dict() if self.gaze_model else None
+            }
+            filter_kind = self.filter_kinds[self.filter_var.get()]
+            self.sample_filter = SampleFilter(filter_kind) if filter_kind else None
+            self.session_metadata['filter'] = self.sample_filter.describe() if self.sample_filter else None
+            self.event_detector = EventDetector(self.event_method, 'gaze' if self.gaze_model else 'eyes')
+            # Sample on exact ticks; the achievable rate is known before the session starts
+            target_rate = int(self.sampling_var.get())
+            if self.replay_path:
+                webcam_fps = self.webcam.get(cv2.CAP_PROP_FPS) or 30.0
+            else:
+                webcam_fps = negotiate_camera_fps(self.webcam, target_rate)
+            self.sampler = RateSampler(target_rate, webcam_fps)
+            self.display_rate = int(self.display_rate_var.get().split()[0])
+            display_sampler = RateSampler(self.display_rate, webcam_fps) if self.display_rate < webcam_fps else None
+            self.session_metadata['display_rate_hz'] = self.display_rate
+            self.session_metadata['webcam_fps'] = webcam_fps
+            self.session_metadata['achievable_rate_hz'] = self.sampler.achievable_rate
+
+            self.webcam_recorder = None
+            if self.record_webcam_var.get():
+                frame_size = (self.session_metadata['webcam_width'], self.session_metadata['webcam_height'])
+                self.webcam_recorder = WebcamRecorder(
+                    os.path.join(self.session_log_dir, session_name + "_webcam.avi"), webcam_fps, frame_size)
+                self.session_metadata['webcam_recording'] = self.webcam_recorder.file_path
+
+            self.media_clock.reset()
+            if self.replay_path:
+                # Timestamps and stimulus times come from the recording's frame index
+                self.capture_thread = CaptureThread(self.webcam, self.frame_buffer, self.webcam.frame_timestamp,
+                                                    self.webcam.media_clock, self.webcam_recorder,
+                                                    self.stage_timers, self.sampler, display_sampler)
+            else:
+                self.capture_thread = CaptureThread(self.webcam, self.frame_buffer, media_clock=self.media_clock,
+                                                    recorder=self.webcam_recorder, timers=self.stage_timers,
+                                                    sampler=self.sampler, display_sampler=display_sampler)
 
             # Reset tracking metrics
             self.sample_count = 0
             self.sample_start_time = time.time()
-            self.last_sample_time = time.time()
+            if self.replay_path:
+                self.sample_start_time = self.webcam.index[0]['timestamp'] if self.webcam.index else 0
+            self.tracker.reset_tracking()
+            self.tracker.reset_stats()
 
             # Update UI
             self.start_btn.config(state=tk.DISABLED)
+            self.calibrate_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
+            self.save_btn.config(state=tk.DISABLED)
             self.status_label.config(
-                text=f"✅ Video e eye tracking in esecuzione a {int(1.0 / self.sampling_rate)} Hz...")
+                text=f"✅ Video e eye tracking in esecuzione | {format_rate_report(self.sampler)}")
 
             # Start video playback in a separate thread
-            threading.Thread(target=self.play_video, daemon=True).start()
+            self.playback_thread = threading.Thread(target=self.play_video, daemon=True)
+            self.playback_thread.start()
 
-            # Start webcam and eye tracking in a separate thread
-            threading.Thread(target=self.track_eyes, daemon=True).start()
+            # Start webcam capture and eye tracking in separate threads
+            self.capture_thread.start()
+            self.tracking_thread = threading.Thread(target=self.track_eyes, daemon=True)
+            self.tracking_thread.start()
 
     def stop_combined(self):
         # Stop both video playback and eye tracking
@@ -238,146 +575,182 @@ class EyeTrackingVideoPlayer:
 
             # Stop webcam and eye tracking
             self.recording = False
+            frames_skipped = 0
+            if self.capture_thread:
+                self.capture_thread.stop()
+                frames_skipped = self.capture_thread.frames_skipped
+                self.capture_thread = None
             if self.webcam:
                 self.webcam.release()
                 self.webcam = None
-
-            # Calculate actual sampling rate
-            if self.sample_count > 0 and time.time() > self.sample_start_time:
+            if self.tracking_thread:
+                # The sample in flight reaches both the store and the log before the log is closed
+                self.tracking_thread.join()
+                self.tracking_thread = None
+            if self.sample_writer:
+                self.sample_writer.close()
+            if self.playback_thread:
+                # The last frame's presentation is in before the playback stats are saved
+                self.playback_thread.join(timeout=1.0)
+                self.playback_thread = None
+            if self.session_name:
+                stats = {'metadata': self.session_metadata, 'samples': self.sample_count}
+                if self.playback:
+                    stats['playback'] = self.playback.report()
+                    stats['presentation_times'] = [round(t, 6) for t in self.playback.presentation_times]
+                self.stage_timers.dump(os.path.join(self.session_log_dir, self.session_name + "_stats.json"),
+                                       stats)
+            if self.webcam_recorder:
+                self.webcam_recorder.close()
+
+            # Calculate actual sampling rate (replayed timestamps are not on the wall clock)
+            if not self.replay_path and self.sample_count > 0 and time.time() > self.sample_start_time:
                 elapsed = time.time() - self.sample_start_time
                 actual_rate = self.sample_count / elapsed
                 self.actual_rate_label.config(text=f"Campioni effettivi: {actual_rate:.1f} Hz")
 
             # Update UI
             self.start_btn.config(state=tk.NORMAL)
+            self.calibrate_btn.config(state=tk.NORMAL)
             self.stop_btn.config(state=tk.DISABLED)
             self.save_btn.config(state=tk.NORMAL)
-            self.status_label.config(text="🛑 Video e eye tracking terminati")
+            status = "🛑 Video e eye tracking terminati"
+            if self.frame_buffer:
+                captured = self.frame_buffer.pushed + self.frame_buffer.dropped_newest
+                status += (f" | Frame acquisiti: {captured}, "
+                           f"scartati: {self.frame_buffer.dropped}, non decodificati: {frames_skipped}")
+            if self.webcam_recorder:
+                status += (f" | Frame webcam registrati: {self.webcam_recorder.frames_written}, "
+                           f"scartati: {self.webcam_recorder.frames_dropped}")
+            if self.playback:
+                status += " | " + format_playback_report(self.playback.report())
+            if self.stimulus_cache:
+                status += " | " + format_cache_report(self.stimulus_cache)
+            if self.tracker.keyframe_interval > 0:
+                status += " | " + format_latency_report(self.tracker.latency_report())
+            self.status_label.config(text=status)
 
     def play_video(self):
         if not self.video_player:
             return
 
         total_frames = int(self.video_player.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = self.video_player.get(cv2.CAP_PROP_FPS)
+        self.playback = PlaybackScheduler(self.video_player, media_clock=self.media_clock)
+        fps = self.playback.fps
         duration = total_frames / fps
+        total_mins, total_secs = divmod(duration, 60)
 
-        while self.is_playing:
-            ret, frame = self.video_player.read()
-
-            if not ret:
-                # Video ended, reset and stop
-                self.video_player.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                self.stop_combined()
-                break
+        def present(frame_index, frame, presentation_time):
+            # frame is None while the video view is hidden (nothing was rendered)
+            if frame is not None:
+                self.video_frame_slot.set(frame)
 
             # Update progress bar
-            current_frame = int(self.video_player.get(cv2.CAP_PROP_POS_FRAMES))
-            current_time = current_frame / fps
-            progress = (current_frame / total_frames) * 100
-
-            self.progress_var.set(progress)
-
+            current_time = (frame_index + 1) / fps
+            progress = ((frame_index + 1) / total_frames) * 100
             mins, secs = divmod(current_time, 60)
-            total_mins, total_secs = divmod(duration, 60)
-            self.time_label.config(
-                text=f"{int(mins):02d}:{int(secs):02d} / {int(total_mins):02d}:{int(total_secs):02d}")
-
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = cv2.resize(frame, (800, 450))
+            self.video_progress_slot.set(
+                (progress, f"{int(mins):02d}:{int(secs):02d} / {int(total_mins):02d}:{int(total_secs):02d}"))
 
-            photo = ImageTk.PhotoImage(image=Image.fromarray(frame))
-            self.video_label.config(image=photo)
-            self.video_label.image = photo
-
-            # Control playback speed
-            time.sleep(1 / fps)  # Adjust for smoother playback
-
-            # Update UI in the main thread
-            self.root.update()
+        # Playback is slaved to the clock, not to decode + sleep
+        if not self.playback.run(lambda: self.is_playing, present, self.video_display.render):
+            # Video ended, reset and let the main thread stop the session
+            self.video_player.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.video_ended_slot.set(True)
 
     def track_eyes(self):
-        if not self.webcam:
+        frame_buffer = self.frame_buffer
+        if not frame_buffer:
             return
 
+        sample_writer = self.sample_writer
+        timers = self.stage_timers
+        webcam_display = self.webcam_display
+        gaze_model = self.gaze_model
+        sample_filter = self.sample_filter
+        event_detector = self.event_detector
+        overlay_text = None
+        frames_displayed = 0
         eye_count = 0
         self.sample_count = 0
 
         while self.recording:
-            ret, frame = self.webcam.read()
-
-            if not ret:
-                break
-
-            current_time = time.time()
-            elapsed = current_time - self.last_sample_time
-
-            # Process frame for display regardless of sampling
-            display_frame = frame.copy()
-
-            # Only process and record eye positions at the specified sampling rate
-            if elapsed >= self.sampling_rate:
-                self.last_sample_time = current_time
+            captured = frame_buffer.get(timeout=0.5)
+
+            if captured is None:
+                if frame_buffer.closed:
+                    break
+                continue
+
+            # Timestamp taken by the capture thread when the frame was grabbed
+            iteration_start = time.perf_counter()
+            frame = captured.frame
+            current_time = captured.timestamp
+            if not self.replay_path:
+                timers.record('queue_wait', max(time.time() - current_time, 0.0))
+
+            # Frames picked by the display sampler are scaled into a reusable display buffer
+            # (None while the webcam view is hidden)
+            display_frame = None
+            if captured.displayed:
+                display_start = time.perf_counter()
+                display_frame = webcam_display.resize(frame)
+                display_time = time.perf_counter() - display_start
+
+            # Only process and record eye positions on the sampler's ticks
+            if captured.sampled:
                 self.sample_count += 1
 
-                # Process frame for eye detection
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-                # Detect faces
-                faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-
-                # Get current video time
-                if self.video_player:
-                    video_time = self.video_player.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                # Detect faces and eyes, keep one left/right pair and locate the pupils
+                with timers.time('detection'):
+                    detections = self.tracker.detect(frame)
+                with timers.time('pupil'):
+                    eyes = eye_sample(detections, frame)
+                if display_frame is not None:
+                    with timers.time('annotation'):
+                        factor_x = display_frame.shape[1] / frame.shape[1]
+                        factor_y = display_frame.shape[0] / frame.shape[0]
+                        draw_detections(display_frame, scale_detections(detections, factor_x, factor_y),
+                                        [(int(x * factor_x), int(y * factor_y))
+                                         for x, y in (eyes[:2], eyes[2:]) if x != MISSING])
+
+                # Video time of the stimulus frame on screen when this frame was grabbed
+                video_time = captured.media.video_time if captured.media else 0
+
+                # Smoothed positions are stored rounded; the gaze uses them unrounded
+                if sample_filter:
+                    filtered = sample_filter.apply(current_time, *eyes)
+                    eyes = tuple(round(value) for value in filtered)
                 else:
-                    video_time = 0
-
-                # Process each face
-                for (x, y, w, h) in faces:
-                    cv2.rectangle(display_frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-
-                    # Region of interest for the face
-                    roi_gray = gray[y:y + h, x:x + w]
-                    roi_color = display_frame[y:y + h, x:x + w]
+                    filtered = eyes
 
-                    # Detect eyes
-                    eyes = self.eye_cascade.detectMultiScale(roi_gray)
+                # Gaze point on the stimulus when calibrated
+                gaze = gaze_model.map_sample(*filtered) if gaze_model else (np.nan, np.nan)
 
-                    eye_count += len(eyes)
+                # Incremental fixation detection on the gaze, or on the eyes when not calibrated
+                event_x, event_y = gaze if gaze_model else eye_features(*filtered)
+                event_detector.add_sample(current_time, video_time, float(event_x), float(event_y))
 
-                    for (ex, ey, ew, eh) in eyes:
-                        # Draw rectangle around the eyes
-                        cv2.rectangle(roi_color, (ex, ey), (ex + ew, ey + eh), (0, 255, 0), 2)
+                # One record per sample, with timestamp and video time
+                self.eye_coords.append_row(self.sample_count, current_time, video_time, *eyes, *gaze)
+                sample_writer.write_row(self.sample_count, current_time, video_time, *eyes, *gaze)
+                eye_count += sum(1 for value in (eyes[0], eyes[2]) if value != MISSING)
 
-                        # Calculate center of the eye
-                        eye_center_x = x + ex + ew // 2
-                        eye_center_y = y + ey + eh // 2
-
-                        # Draw center point
-                        cv2.circle(display_frame, (eye_center_x, eye_center_y), 2, (0, 0, 255), 2)
-
-                        # Save eye coordinates with timestamp and video time
-                        self.eye_coords.append({
-                            'timestamp': current_time,
-                            'video_time': video_time,
-                            'eye_x': eye_center_x,
-                            'eye_y': eye_center_y,
-                            'sample_number': self.sample_count
-                        })
-
-                # Calculate and display actual sampling rate
+                # Calculate actual sampling rate and update metrics
+                rate_text = None
                 if self.sample_count > 1:
                     elapsed_total = current_time - self.sample_start_time
                     actual_rate = self.sample_count / elapsed_total
-                    self.actual_rate_label.config(text=f"Campioni effettivi: {actual_rate:.1f} Hz")
+                    rate_text = f"Campioni effettivi: {actual_rate:.1f} Hz"
 
-                # Update metrics
-                self.metrics_label.config(
-                    text=f"Punti tracciati: {len(self.eye_coords)} | Campioni: {self.sample_count}")
+                self.tracking_metrics_slot.set(
+                    (rate_text, f"Campioni: {self.sample_count} | Occhi rilevati: {eye_count} | "
+                                f"Frame scartati: {frame_buffer.dropped} | "
+                                f"Fissazioni: {event_detector.fixation_count}"))
 
-            # Display the frame (always, regardless of sampling)
-            display_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            display_frame = cv2.resize(display_frame, (400, 300))
+            if display_frame is None:
+                timers.record('iteration', time.perf_counter() - iteration_start)
+                continue
 
             # Add sampling rate text to display frame
             target_rate = int(1.0 / self.sampling_rate)
@@ -390,12 +763,47 @@ class EyeTrackingVideoPlayer:
                 cv2.putText(display_frame, f"Actual: {actual_rate:.1f} Hz", (10, 40),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-            photo = ImageTk.PhotoImage(image=Image.fromarray(display_frame))
-            self.webcam_label.config(image=photo)
-            self.webcam_label.image = photo
+            # Live latency overlay, percentiles refreshed every 15 displayed frames
+            if frames_displayed % 15 == 0:
+                detection_p95 = timers.p95_ms('detection')
+                overlay_text = f"Det p95: {detection_p95:.1f} ms" if detection_p95 is not None else None
+            if overlay_text:
+                cv2.putText(display_frame, overlay_text, (10, 60),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-            # Update UI in the main thread
-            self.root.update()
+            # Display the frame (throttled to the screen refresh rate, regardless of sampling)
+            display_start = time.perf_counter()
+            self.webcam_frame_slot.set(webcam_display.publish())
+            timers.record('display', display_time + time.perf_counter() - display_start)
+            frames_displayed += 1
+            timers.record('iteration', time.perf_counter() - iteration_start)
+
+    def show_video_frame(self, image):
+        self.video_surface.show(image)
+
+    def show_video_progress(self, progress):
+        value, time_text = progress
+        self.progress_var.set(value)
+        self.time_label.config(text=time_text)
+
+    def show_webcam_frame(self, image):
+        with self.stage_timers.time('render'):
+            self.webcam_surface.show(image)
+
+    def update_latency_panel(self):
+        snapshot = self.stage_timers.snapshot()
+        if snapshot:
+            self.latency_label.config(text="Latenze p50/p95: " + format_stage_line(
+                snapshot,
+                ('camera_interval', 'capture', 'queue_wait', 'detection', 'pupil', 'annotation', 'display', 'render'),
+                ('Camera', 'Cattura', 'Coda', 'Rilevamento', 'Pupilla', 'Annotazione', 'Display', 'Tk')))
+        self.root.after(500, self.update_latency_panel)
+
+    def show_tracking_metrics(self, metrics):
+        rate_text, metrics_text = metrics
+        if rate_text:
+            self.actual_rate_label.config(text=rate_text)
+        self.metrics_label.config(text=metrics_text)
 
     def save_eye_data(self):
         if not self.eye_coords:
@@ -405,17 +813,33 @@ class EyeTrackingVideoPlayer:
         file_path = filedialog.asksaveasfilename(
             title="Salva dati eye tracking",
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+            filetypes=[("CSV files", "*.csv"), ("Parquet files", "*.parquet"), ("Arrow files", "*.arrow"),
+                       ("NumPy archive", "*.npz"), ("All files", "*.*")]
         )
 
-        if file_path:
-            with open(file_path, 'w') as f:
-                f.write("sample_number,timestamp,video_time,eye_x,eye_y\n")
-                for coord in self.eye_coords:
-                    f.write(
-                        f"{coord['sample_number']},{coord['timestamp']},{coord['video_time']},{coord['eye_x']},{coord['eye_y']}\n")
+        if not file_path:
+            return
 
-            self.status_label.config(text=f"✅ Dati salvati in: {file_path}")
+        # The session log can only be moved once its writer has finished appending to it
+        log_path = self.sample_writer.file_path if self.sample_writer and self.sample_writer.closed else None
+        if os.path.splitext(file_path)[1].lower() in EXPORT_FORMATS:
+            try:
+                export_samples(self.eye_coords.columns(), file_path, self.session_metadata)
+            except ImportError as exc:
+                self.status_label.config(text=f"⚠️ {exc}")
+                return
+        elif log_path and file_path.lower().endswith(".csv") and os.path.exists(log_path):
+            # The session log is already the CSV: moving it is a rename on the same disk
+            shutil.move(log_path, file_path)
+            self.sample_writer = None
+        else:
+            write_samples_csv(self.eye_coords, file_path)
+
+        # Fixation and saccade tables next to the samples, keyed by video time
+        fixations, saccades = detect_events(self.eye_coords.columns(), self.event_method)
+        save_events(fixations, saccades, os.path.splitext(file_path)[0])
+        self.status_label.config(text=f"✅ Dati salvati in: {file_path} | Fissazioni: {len(fixations['duration'])} | "
+                                      f"Saccadi: {len(saccades['duration'])}")
 
 
 if __name__ == "__main__":
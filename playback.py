@@ -0,0 +1,129 @@
+import collections
+import time
+
+import cv2
+
+MediaClockState = collections.namedtuple('MediaClockState', ['frame_index', 'video_time', 'presented_at'])
+
+
+class MediaClock:
+    # Authoritative playback position, published by the playback scheduler when a frame is
+    # presented. The state is swapped in one reference assignment, so readers on other threads
+    # get a consistent (frame, time) pair without locks or calls into the VideoCapture.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = MediaClockState(-1, 0.0, None)
+
+    def publish(self, frame_index, video_time, presented_at=None):
+        self.state = MediaClockState(frame_index, video_time,
+                                     presented_at if presented_at is not None else time.time())
+
+    def read(self):
+        return self.state
+
+
+class PlaybackScheduler:
+    # Paces a VideoCapture on a monotonic clock: frame n is presented at start + n / fps.
+    # Frames are decoded and prepared ahead of their deadline; when playback falls behind,
+    # frames whose slot has already passed are skipped with grab() instead of decoded.
+    def __init__(self, capture, fps=None, clock=time.perf_counter, sleep=time.sleep, media_clock=None):
+        self.capture = capture
+        self.media_clock = media_clock
+        self.fps = fps or capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.clock = clock
+        self.sleep = sleep
+        self.late_threshold = 0.5 / self.fps
+        self.reset()
+
+    def reset(self):
+        self.start_time = None
+        self.presentation_times = []
+        self.frames_presented = 0
+        self.frames_dropped = 0
+        self.frames_late = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    def run(self, is_running, present, prepare=None, start_frame=None):
+        # prepare(frame) runs before the deadline, present(frame_index, frame, t) at the deadline,
+        # with t the presentation time in seconds since playback start.
+        # Playback resumes from the capture's position unless start_frame is given (the capture
+        # is then moved there), so frame indices always match the decoded frames.
+        # Returns False if the video ended, True if stopped by is_running().
+        self.reset()
+        if start_frame is None:
+            start_frame = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        elif start_frame != int(self.capture.get(cv2.CAP_PROP_POS_FRAMES)):
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_interval = 1.0 / self.fps
+        start = self.clock() - start_frame * frame_interval
+        self.start_time = start
+        frame_index = start_frame
+
+        while is_running():
+            # Skip the frames whose presentation slot is already over
+            while self.clock() - start >= (frame_index + 1) * frame_interval:
+                if not self.capture.grab():
+                    return False
+                frame_index += 1
+                self.frames_dropped += 1
+
+            ret, frame = self.capture.read()
+            if not ret:
+                return False
+
+            if prepare:
+                frame = prepare(frame)
+
+            deadline = start + frame_index * frame_interval
+            wait = deadline - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+
+            presented = self.clock()
+            lateness = presented - deadline
+            if lateness > self.late_threshold:
+                self.frames_late += 1
+            self.max_lateness = max(self.max_lateness, lateness)
+            self.total_lateness += max(lateness, 0.0)
+
+            self.presentation_times.append(presented - start)
+            self.frames_presented += 1
+            if self.media_clock:
+                # frame_index counts from the capture's position at start, so it is the decoded frame
+                self.media_clock.publish(frame_index, frame_index * frame_interval)
+            present(frame_index, frame, presented - start)
+            frame_index += 1
+
+        return True
+
+    def report(self):
+        presented = self.frames_presented
+        return {
+            'fps': self.fps,
+            'presented': presented,
+            'dropped': self.frames_dropped,
+            'late': self.frames_late,
+            'mean_lateness_ms': self.total_lateness / presented * 1000 if presented else 0.0,
+            'max_lateness_ms': self.max_lateness * 1000,
+            'presentation_interval_ms': self.interval_summary()
+        }
+
+    def interval_summary(self):
+        # Intervals between consecutive presentations, ms (None before two frames were shown)
+        times = self.presentation_times
+        intervals = sorted(later - earlier for earlier, later in zip(times, times[1:]))
+        if not intervals:
+            return None
+        return {
+            'mean': sum(intervals) / len(intervals) * 1000,
+            'p95': intervals[int(0.95 * (len(intervals) - 1))] * 1000,
+            'max': intervals[-1] * 1000
+        }
+
+
+def format_playback_report(report):
+    return (f"Frame video mostrati: {report['presented']}, saltati: {report['dropped']}, "
+            f"in ritardo: {report['late']} (max {report['max_lateness_ms']:.1f} ms)")
@@ -0,0 +1,52 @@
+import cv2
+
+
+def negotiate_camera_fps(capture, target_rate, default=30.0):
+    # Asks the camera for at least target_rate frames per second and returns what it reports
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    if fps and fps < target_rate and hasattr(capture, 'set'):
+        capture.set(cv2.CAP_PROP_FPS, target_rate)
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    return fps if fps and fps > 0 else default
+
+
+class RateSampler:
+    # Samples on exact ticks t0 + k / rate: each tick takes the first camera frame at or after it
+    # (within half a frame interval of jitter). The decision is made from the grab timestamp,
+    # before the frame is decoded, so unsampled frames never need to be retrieved.
+    def __init__(self, target_rate, camera_fps):
+        self.target_rate = target_rate
+        self.camera_fps = camera_fps
+        self.period = 1.0 / target_rate
+        self.tolerance = 0.5 / camera_fps if camera_fps else 0.0
+        self.start_time = None
+        self.next_tick = 0
+        self.samples = 0
+        self.missed_ticks = 0
+
+    @property
+    def achievable_rate(self):
+        # A tick can only be served by a distinct camera frame
+        return min(self.target_rate, self.camera_fps)
+
+    def should_sample(self, timestamp):
+        if self.start_time is None:
+            self.start_time = timestamp
+
+        tick_position = (timestamp - self.start_time + self.tolerance) / self.period
+        if tick_position < self.next_tick:
+            return False
+
+        # Ticks that passed without a frame of their own are counted, not sampled twice
+        current_tick = int(tick_position)
+        self.missed_ticks += current_tick - self.next_tick
+        self.next_tick = current_tick + 1
+        self.samples += 1
+        return True
+
+
+def format_rate_report(sampler):
+    text = f"Richiesti {sampler.target_rate:g} Hz, webcam a {sampler.camera_fps:g} fps"
+    if sampler.achievable_rate < sampler.target_rate:
+        return text + f": campionamento massimo {sampler.achievable_rate:g} Hz"
+    return text + f": campionamento a {sampler.achievable_rate:g} Hz"
@@ -0,0 +1,157 @@
+"""Deterministic replay of a recorded webcam session through the tracker.
+
+Uses the file written by WebcamRecorder and its <name>.frames.csv sidecar, so
+timestamps and stimulus times are the recorded ones, not the replay's.
+
+    python replay_source.py session_webcam.avi --rate 30 -o replay.csv
+    python replay_source.py session_webcam.avi --realtime
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+from playback import MediaClockState
+from rate_sampler import RateSampler
+from sample_store import SampleStore
+from tracking_engine import EyeTracker, eye_sample, write_samples_csv
+from webcam_recorder import index_path_for, load_frame_index
+
+
+class ReplayCapture:
+    # Stand-in for cv2.VideoCapture(0) that serves a recorded webcam file. With realtime=True
+    # frames are released at their original capture intervals, otherwise as fast as decoded.
+    # frame_timestamp() and media_clock expose the recorded values of the last grabbed frame,
+    # to be passed to CaptureThread as clock and media_clock.
+    def __init__(self, file_path, index_path=None, realtime=False, clock=time.perf_counter, sleep=time.sleep):
+        self.capture = cv2.VideoCapture(file_path)
+        self.index = load_frame_index(index_path or index_path_for(file_path))
+        self.realtime = realtime
+        self.clock = clock
+        self.sleep = sleep
+        self.position = -1
+        self.replay_start = None
+        self.media_clock = ReplayMediaClock(self)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def grab(self):
+        if self.position + 1 >= len(self.index) or not self.capture.grab():
+            return False
+        self.position += 1
+
+        if self.realtime:
+            # Wait until the frame's original offset from the first frame
+            offset = self.index[self.position]['timestamp'] - self.index[0]['timestamp']
+            if self.replay_start is None:
+                self.replay_start = self.clock()
+            wait = self.replay_start + offset - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+        return True
+
+    def retrieve(self):
+        return self.capture.retrieve()
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.capture.release()
+
+    def current_row(self):
+        return self.index[max(self.position, 0)]
+
+    def frame_timestamp(self):
+        return self.current_row()['timestamp']
+
+
+class ReplayMediaClock:
+    def __init__(self, replay):
+        self.replay = replay
+
+    def read(self):
+        row = self.replay.current_row()
+        return MediaClockState(row['video_frame'], row['video_time'], row['timestamp'])
+
+
+def replay_session(recording_path, sampling_rate=0.033, tracker=None, realtime=False):
+    # Samples the recorded timestamps with the same RateSampler as the live tracker, at the
+    # recorded frame rate, so the replay keeps the frames a live session would have kept.
+    # Returns (SampleStore, stats) where stats has throughput figures for benchmarking.
+    tracker = tracker or EyeTracker()
+    tracker.reset_tracking()
+    replay = ReplayCapture(recording_path, realtime=realtime)
+    if not replay.isOpened():
+        raise IOError(f"Impossibile aprire la registrazione webcam: {recording_path}")
+
+    sampler = RateSampler(1.0 / sampling_rate, replay.get(cv2.CAP_PROP_FPS) or 30.0)
+    samples = SampleStore()
+    sample_count = 0
+    frames = 0
+    start = time.perf_counter()
+
+    try:
+        while True:
+            ret, frame = replay.read()
+            if not ret:
+                break
+            frames += 1
+
+            current_time = replay.frame_timestamp()
+            if not sampler.should_sample(current_time):
+                continue
+            sample_count += 1
+
+            video_time = replay.media_clock.read().video_time
+            samples.append_row(sample_count, current_time, video_time, *eye_sample(tracker.detect(frame), frame))
+    finally:
+        replay.release()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'frames': frames,
+        'samples': sample_count,
+        'points': len(samples),
+        'elapsed_s': elapsed,
+        'frames_per_s': frames / elapsed if elapsed else 0.0,
+        'samples_per_s': sample_count / elapsed if elapsed else 0.0
+    }
+    return samples, stats
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Replay di una registrazione webcam attraverso il tracker")
+    parser.add_argument('recording', help="Registrazione webcam con il relativo .frames.csv")
+    parser.add_argument('-o', '--output', help="File CSV di output (default: <registrazione>_replay.csv)")
+    parser.add_argument('--rate', type=float, default=30, help="Frequenza di campionamento in Hz")
+    parser.add_argument('--realtime', action='store_true', help="Rispetta i tempi originali di acquisizione")
+    parser.add_argument('--detection-scale', type=float, default=1.0)
+    parser.add_argument('--keyframe-interval', type=int, default=0)
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    output = args.output or os.path.splitext(args.recording)[0] + '_replay.csv'
+
+    tracker = EyeTracker(keyframe_interval=args.keyframe_interval, detection_scale=args.detection_scale)
+    samples, stats = replay_session(args.recording, 1.0 / args.rate, tracker, args.realtime)
+    write_samples_csv(samples, output)
+
+    print(f"{stats['points']} campioni salvati in: {output}")
+    print(f"{stats['frames']} frame in {stats['elapsed_s']:.2f} s "
+          f"({stats['frames_per_s']:.1f} frame/s, {stats['samples_per_s']:.1f} campioni/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Typed, columnar export of gaze samples.
+
+    .parquet  zstd-compressed, typed columns; read single columns with
+              pandas.read_parquet(path, columns=[...])
+    .arrow    Arrow IPC (Feather v2), uncompressed so it can be memory-mapped:
+              load_columns(path, ['left_x', 'left_y']) reads nothing else from disk
+    .npz      compressed NumPy archive, members are loaded lazily one column at a time
+
+Session metadata (video path, FPS, sampling rate, webcam resolution) is stored in
+the file: as schema metadata for Parquet/Arrow and as a JSON member for NPZ.
+Parquet and Arrow need pyarrow, NPZ only needs NumPy.
+"""
+import json
+import os
+
+import numpy as np
+
+from sample_store import SAMPLE_DTYPES
+
+METADATA_KEY = 'eye_tracking'
+EXPORT_FORMATS = ('.parquet', '.arrow', '.feather', '.npz')
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ImportError("L'esportazione Parquet/Arrow richiede pyarrow (pip install pyarrow)") from exc
+    return pyarrow
+
+
+def _arrow_table(columns, metadata):
+    pa = _require_pyarrow()
+    table = pa.table({name: np.asarray(columns[name], dtype) for name, dtype in SAMPLE_DTYPES})
+    return table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata or {})})
+
+
+def export_parquet(columns, file_path, metadata=None):
+    pa = _require_pyarrow()
+    pa.parquet.write_table(_arrow_table(columns, metadata), file_path, compression='zstd')
+
+
+def export_arrow(columns, file_path, metadata=None):
+    pa = _require_pyarrow()
+    pa.feather.write_feather(_arrow_table(columns, metadata), file_path, compression='uncompressed')
+
+
+def export_npz(columns, file_path, metadata=None):
+    arrays = {name: np.asarray(columns[name], dtype) for name, dtype in SAMPLE_DTYPES}
+    np.savez_compressed(file_path, metadata=np.array(json.dumps(metadata or {})), **arrays)
+
+
+def export_samples(columns, file_path, metadata=None):
+    # columns: dict of column arrays, e.g. SampleStore.columns()
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.parquet':
+        export_parquet(columns, file_path, metadata)
+    elif extension in ('.arrow', '.feather'):
+        export_arrow(columns, file_path, metadata)
+    elif extension == '.npz':
+        export_npz(columns, file_path, metadata)
+    else:
+        raise ValueError(f"Formato di esportazione non supportato: {extension}")
+
+
+def load_columns(file_path, columns=None):
+    # Returns (dict of column arrays, metadata); only the requested columns are read
+    extension = os.path.splitext(file_path)[1].lower()
+    names = columns or [name for name, _ in SAMPLE_DTYPES]
+
+    if extension == '.npz':
+        with np.load(file_path) as archive:
+            metadata = json.loads(archive['metadata'].item())
+            return {name: archive[name] for name in names}, metadata
+
+    pa = _require_pyarrow()
+    if extension == '.parquet':
+        table = pa.parquet.read_table(file_path, columns=names, memory_map=True)
+    elif extension in ('.arrow', '.feather'):
+        table = pa.feather.read_table(file_path, columns=names, memory_map=True)
+    else:
+        raise ValueError(f"Formato non supportato: {extension}")
+
+    metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY.encode(), b'{}'))
+    return {name: table.column(name).to_numpy() for name in names}, metadata
+
+
+def iter_columns(file_path, columns, chunk_size=1_000_000):
+    # Yields dicts of column arrays of at most chunk_size rows, without loading the whole file:
+    # Parquet is read one record batch at a time, Arrow is memory-mapped and sliced.
+    # NPZ members are compressed and can only be read whole, one column at a time.
+    extension = os.path.splitext(file_path)[1].lower()
+
+    if extension == '.npz':
+        with np.load(file_path) as archive:
+            arrays = {name: archive[name] for name in columns}
+        total = len(arrays[columns[0]])
+        for start in range(0, total, chunk_size):
+            yield {name: array[start:start + chunk_size] for name, array in arrays.items()}
+        return
+
+    pa = _require_pyarrow()
+    if extension == '.parquet':
+        parquet_file = pa.parquet.ParquetFile(file_path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns}
+    elif extension in ('.arrow', '.feather'):
+        table = pa.feather.read_table(file_path, columns=columns, memory_map=True)
+        for start in range(0, table.num_rows, chunk_size):
+            chunk = table.slice(start, chunk_size)
+            yield {name: chunk.column(name).to_numpy() for name in columns}
+    else:
+        raise ValueError(f"Formato non supportato: {extension}")
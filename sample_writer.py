@@ -0,0 +1,93 @@
+import os
+import queue
+import threading
+import time
+
+from sample_store import SAMPLE_DTYPES
+
+
+class StreamingSampleWriter:
+    # Appends samples to a CSV log on a background thread while recording. Rows are written
+    # in batches with a single write call and fsync'd every fsync_interval seconds, so a crash
+    # loses at most that much data. Pending rows are bounded by max_pending.
+    def __init__(self, file_path, batch_size=256, fsync_interval=1.0, max_pending=8192):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(max_pending)
+        # Serializes the closed check with the put, so no row can follow the end-of-log sentinel
+        self.lock = threading.Lock()
+        self.closed = False
+        self.rows_written = 0
+        self.fsync_count = 0
+
+        self.file = open(file_path, 'w')
+        self.file.write(",".join(name for name, _ in SAMPLE_DTYPES) + "\n")
+        self._sync()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write_row(self, sample_number, timestamp, video_time, left_x, left_y, right_x, right_y,
+                  gaze_x=float('nan'), gaze_y=float('nan')):
+        # Returns False for a row arriving after close(), which is not written. A full queue
+        # blocks until the writer thread, which is still running while open, drains it.
+        with self.lock:
+            if self.closed:
+                return False
+            self.queue.put((sample_number, timestamp, video_time, left_x, left_y, right_x, right_y, gaze_x, gaze_y))
+            return True
+
+    def close(self):
+        # Only the rows still queued are written here, finalizing does not depend on session length
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.fsync_count += 1
+
+    def _run(self):
+        last_sync = time.monotonic()
+        dirty = False
+        stop = False
+
+        while not stop:
+            try:
+                row = self.queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                row = ()
+
+            batch = []
+            if row is None:
+                stop = True
+            elif row:
+                batch.append(row)
+                while len(batch) < self.batch_size:
+                    try:
+                        row = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        stop = True
+                        break
+                    batch.append(row)
+
+            if batch:
+                self.file.write("".join(f"{n},{t},{vt},{lx},{ly},{rx},{ry},{gx:.2f},{gy:.2f}\n"
+                                        for n, t, vt, lx, ly, rx, ry, gx, gy in batch))
+                self.rows_written += len(batch)
+                dirty = True
+
+            now = time.monotonic()
+            if dirty and (stop or now - last_sync >= self.fsync_interval):
+                self._sync()
+                last_sync = now
+                dirty = False
+
+        self.file.close()
@@ -0,0 +1,152 @@
+"""Parallel offline reprocessing of recorded webcam sessions.
+
+Splits every session into frame chunks, tracks them in a pool of worker
+processes (one per core by default) and merges the chunks back into one
+sample CSV per session.
+
+    python session_farm.py sessions/*.mp4 --video stimulus.mp4 --output-dir out --rate 60
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+from tracking_engine import EyeTracker, StimulusTimeline, track_frames, write_samples_csv
+
+_worker_tracker = None
+
+
+def _init_worker(scale_factor, min_neighbors, keyframe_interval, roi_margin, detection_scale):
+    global _worker_tracker
+    # One process per core: keep OpenCV from spawning its own threads on top
+    cv2.setNumThreads(1)
+    _worker_tracker = EyeTracker(scale_factor, min_neighbors, keyframe_interval, roi_margin, detection_scale)
+
+
+def _track_chunk(task):
+    session_index, chunk_index, webcam_path, timeline, sampling_rate, start_time, start_frame, end_frame = task
+    samples, sample_count = track_frames(webcam_path, timeline, sampling_rate, _worker_tracker,
+                                         start_time, start_frame, end_frame)
+    return session_index, chunk_index, samples, sample_count
+
+
+def count_frames(webcam_path):
+    webcam = cv2.VideoCapture(webcam_path)
+    if not webcam.isOpened():
+        raise IOError(f"Impossibile aprire la registrazione webcam: {webcam_path}")
+    try:
+        return int(webcam.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        webcam.release()
+
+
+def plan_chunks(frame_count, chunk_frames):
+    if chunk_frames <= 0 or frame_count <= 0:
+        return [(0, None)]
+    return [(start, min(start + chunk_frames, frame_count)) for start in range(0, frame_count, chunk_frames)]
+
+
+def merge_chunks(chunks):
+    # chunks: [(samples, sample_count), ...] in frame order; sample numbers restart in every chunk
+    merged = []
+    offset = 0
+    for samples, sample_count in chunks:
+        for coord in samples:
+            coord['sample_number'] += offset
+        merged.extend(samples)
+        offset += sample_count
+    return merged
+
+
+class Session:
+    def __init__(self, webcam_path, video_path, output_path, start_time=0.0, video_offset=0.0):
+        self.webcam_path = webcam_path
+        self.video_path = video_path
+        self.output_path = output_path
+        self.start_time = start_time
+        self.video_offset = video_offset
+
+
+def run_farm(sessions, sampling_rate=0.033, workers=None, chunk_frames=900,
+             scale_factor=1.3, min_neighbors=5, keyframe_interval=0, roi_margin=0.5,
+             detection_scale=1.0, on_session_done=None):
+    workers = workers or os.cpu_count() or 1
+
+    tasks = []
+    pending = {}
+    for session_index, session in enumerate(sessions):
+        timeline = StimulusTimeline.from_video(session.video_path, session.video_offset)
+        chunks = plan_chunks(count_frames(session.webcam_path), chunk_frames)
+        pending[session_index] = [None] * len(chunks)
+        for chunk_index, (start_frame, end_frame) in enumerate(chunks):
+            tasks.append((session_index, chunk_index, session.webcam_path, timeline, sampling_rate,
+                          session.start_time, start_frame, end_frame))
+
+    results = {}
+    with multiprocessing.Pool(workers, _init_worker,
+                              (scale_factor, min_neighbors, keyframe_interval, roi_margin,
+                               detection_scale)) as pool:
+        for session_index, chunk_index, samples, sample_count in pool.imap_unordered(_track_chunk, tasks):
+            chunks = pending[session_index]
+            chunks[chunk_index] = (samples, sample_count)
+
+            # Write each session as soon as its last chunk comes back
+            if all(chunk is not None for chunk in chunks):
+                session = sessions[session_index]
+                merged = merge_chunks(chunks)
+                write_samples_csv(merged, session.output_path)
+                results[session.webcam_path] = len(merged)
+                del pending[session_index]
+                if on_session_done:
+                    on_session_done(session, len(merged))
+
+    return results
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Rielaborazione parallela di sessioni webcam registrate")
+    parser.add_argument('webcams', nargs='+', help="Registrazioni webcam da elaborare")
+    parser.add_argument('--video', required=True, help="Video stimolo mostrato durante le sessioni")
+    parser.add_argument('--output-dir', default='.', help="Cartella dei CSV per sessione")
+    parser.add_argument('--rate', type=float, default=30, help="Frequenza di campionamento in Hz")
+    parser.add_argument('--workers', type=int, default=None, help="Processi (default: uno per core)")
+    parser.add_argument('--chunk-frames', type=int, default=900,
+                        help="Frame per blocco di lavoro (0 = una sessione per processo)")
+    parser.add_argument('--video-offset', type=float, default=0.0,
+                        help="Secondi tra l'inizio della registrazione e l'avvio del video")
+    parser.add_argument('--scale-factor', type=float, default=1.3)
+    parser.add_argument('--min-neighbors', type=int, default=5)
+    parser.add_argument('--keyframe-interval', type=int, default=0,
+                        help="Ricerca completa del volto ogni N campioni (0 = sempre)")
+    parser.add_argument('--roi-margin', type=float, default=0.5)
+    parser.add_argument('--detection-scale', type=float, default=1.0,
+                        help="Scala del frame per la ricerca del volto (es. 0.5 o 0.25)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    sessions = []
+    for webcam_path in args.webcams:
+        name = os.path.splitext(os.path.basename(webcam_path))[0]
+        sessions.append(Session(webcam_path, args.video, os.path.join(args.output_dir, name + '.csv'),
+                                video_offset=args.video_offset))
+
+    def report(session, count):
+        print(f"{count} punti tracciati salvati in: {session.output_path}")
+
+    start = time.perf_counter()
+    run_farm(sessions, 1.0 / args.rate, args.workers, args.chunk_frames,
+             args.scale_factor, args.min_neighbors, args.keyframe_interval, args.roi_margin,
+             args.detection_scale, report)
+    print(f"{len(sessions)} sessioni elaborate in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
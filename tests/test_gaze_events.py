@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from gaze_events import FIXATION_COLUMNS, SACCADE_COLUMNS, EventDetector, detect_events
+
+
+def eye_columns(rate, seconds=60, step=0.0, seed=0):
+    # Still eyes with sub-pixel jitter, stored as int32 like the tracker does; with step, the
+    # gaze jumps by step webcam pixels every second
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rate * seconds)) / rate
+    x = 320.0 + step * (np.floor(t) % 2)
+    columns = {'timestamp': t, 'video_time': t}
+    for name, values, offset in (('left_x', x, -30), ('left_y', 240.0, 0), ('right_x', x, 30),
+                                 ('right_y', 240.0, 0)):
+        columns[name] = np.rint(values + offset + rng.normal(0, 0.5, len(t))).astype(np.int32)
+    return columns
+
+
+@pytest.mark.parametrize('rate', [30, 60, 120])
+def test_still_eyes_with_jitter_are_one_fixation(rate):
+    fixations, saccades = detect_events(eye_columns(rate), 'ivt', 'eyes')
+    assert len(fixations['duration']) == 1
+    assert len(saccades['duration']) <= 1
+    assert fixations['duration'][0] > 59
+
+
+@pytest.mark.parametrize('rate', [30, 60, 120])
+def test_eye_steps_are_saccades(rate):
+    fixations, saccades = detect_events(eye_columns(rate, step=5), 'ivt', 'eyes')
+    assert len(fixations['duration']) == 60
+    assert 59 <= len(saccades['duration']) <= 60
+
+
+@pytest.mark.parametrize('method', ['ivt', 'idt'])
+def test_chunked_detection_matches_whole_session(method):
+    columns = eye_columns(120, seconds=20, step=5)
+    x = (columns['left_x'] + columns['right_x']) / 2
+    y = (columns['left_y'] + columns['right_y']) / 2
+    t = columns['timestamp']
+    whole = EventDetector(method, 'eyes').feed(t, t, x, y, final=True)
+
+    detector = EventDetector(method, 'eyes')
+    parts = [detector.feed(t[i:i + 7], t[i:i + 7], x[i:i + 7], y[i:i + 7]) for i in range(0, len(t), 7)]
+    parts.append(detector.finish())
+    for index, names in ((0, FIXATION_COLUMNS), (1, SACCADE_COLUMNS)):
+        for name in names:
+            np.testing.assert_allclose(np.concatenate([part[index][name] for part in parts]), whole[index][name])
@@ -0,0 +1,85 @@
+import cv2
+
+from playback import MediaClock, PlaybackScheduler
+
+
+class FakeCapture:
+    # Decodes frame n as the integer n; position is the next frame to decode
+    def __init__(self, frame_count, position=0):
+        self.frame_count = frame_count
+        self.position = position
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_FPS:
+            return 25.0
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+        return True
+
+    def grab(self):
+        if self.position >= self.frame_count:
+            return False
+        self.position += 1
+        return True
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return True, self.position - 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def run_frames(capture, count, **kwargs):
+    clock = FakeClock()
+    media_clock = MediaClock()
+    scheduler = PlaybackScheduler(capture, clock=clock, sleep=clock.sleep, media_clock=media_clock)
+    presented = []
+
+    def present(frame_index, frame, presentation_time):
+        presented.append((frame_index, frame, media_clock.read().frame_index, media_clock.read().video_time))
+
+    scheduler.run(lambda: len(presented) < count, present, **kwargs)
+    return presented
+
+
+def test_restart_resumes_from_capture_position():
+    # A capture left at frame 100 by a stopped session: indices follow the decoded frames
+    presented = run_frames(FakeCapture(200, position=100), 3)
+    assert [(frame_index, frame) for frame_index, frame, _, _ in presented] == [(100, 100), (101, 101), (102, 102)]
+
+
+def test_start_frame_seeks_the_capture():
+    presented = run_frames(FakeCapture(200, position=100), 2, start_frame=0)
+    assert [(frame_index, frame) for frame_index, frame, _, _ in presented] == [(0, 0), (1, 1)]
+
+
+def test_media_clock_publishes_decoded_frame_after_restart():
+    # Gaze samples take their video_time from the media clock
+    presented = run_frames(FakeCapture(200, position=100), 3)
+    for _, frame, clock_index, video_time in presented:
+        assert clock_index == frame
+        assert video_time == frame / 25.0
+
+
+def test_report_summarizes_presentation_intervals():
+    clock = FakeClock()
+    scheduler = PlaybackScheduler(FakeCapture(10), clock=clock, sleep=clock.sleep)
+    scheduler.run(lambda: True, lambda frame_index, frame, t: None)
+    report = scheduler.report()
+    assert len(scheduler.presentation_times) == 10
+    assert abs(report['presentation_interval_ms']['mean'] - 40.0) < 1e-6
@@ -0,0 +1,180 @@
+import itertools
+from tkinter import EventType
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class LatestValue:
+    # Single-slot mailbox between a worker thread and the Tk thread. set() replaces the
+    # (version, value) tuple in one reference assignment, which is atomic in CPython, so
+    # neither side ever takes a lock and the reader always sees a consistent pair.
+    def __init__(self):
+        self._versions = itertools.count(1)
+        self._slot = (0, None)
+
+    def set(self, value):
+        self._slot = (next(self._versions), value)
+
+    def get(self):
+        return self._slot[1]
+
+    def get_if_newer(self, version):
+        # Returns (version, value) when something newer than `version` was published, else None
+        slot = self._slot
+        if slot[0] > version:
+            return slot
+        return None
+
+
+class RenderScheduler:
+    # Runs on the Tk main thread via root.after and hands the latest value of each slot to its
+    # callback. Worker threads only publish into slots and never touch Tk themselves.
+    def __init__(self, root, interval_ms=15):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.targets = []
+        self.after_id = None
+
+    def add(self, slot, callback):
+        self.targets.append([slot, callback, 0])
+
+    def start(self):
+        if self.after_id is None:
+            self.after_id = self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _tick(self):
+        # Reschedule first so a failing callback cannot stop the render loop
+        self.after_id = self.root.after(self.interval_ms, self._tick)
+
+        for target in self.targets:
+            slot, callback, version = target
+            latest = slot.get_if_newer(version)
+            if latest is not None:
+                target[2] = latest[0]
+                callback(latest[1])
+
+
+def fit_size(frame_shape, box):
+    # Largest size that fits `box` with the frame's aspect ratio, never larger than the frame
+    height, width = frame_shape[:2]
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+class DisplayBuffers:
+    # Preallocated destination buffers for one view, filled on a worker thread. A frame is resized
+    # into a display-sized BGR buffer (where overlays are drawn) and converted into an RGBA buffer
+    # that a PIL image shares, so no array or image is allocated per frame. Buffers rotate over
+    # `count` slots: the Tk thread pastes the latest published slot while the next one is filled.
+    # The display size follows the box and visibility requested by the Tk side (PhotoSurface):
+    # buffers are reallocated only when the fitted size changes, and hidden views are not rendered.
+    def __init__(self, box, count=3):
+        self.count = count
+        self.request = (box, True)
+        self.size = None
+        self.slots = []
+        self.position = 0
+
+    def set_target(self, box, visible=True):
+        # Called from the Tk thread; a single tuple assignment, read once per frame by the worker
+        self.request = (box, visible)
+
+    @property
+    def visible(self):
+        return self.request[1]
+
+    def _allocate(self, size):
+        width, height = size
+        self.size = size
+        self.slots = []
+        for _ in range(self.count):
+            bgr = np.empty((height, width, 3), np.uint8)
+            rgba = np.empty((height, width, 4), np.uint8)
+            self.slots.append((bgr, rgba, Image.frombuffer('RGBA', size, rgba, 'raw', 'RGBA', 0, 1)))
+
+    def resize(self, frame):
+        # Returns the next slot's BGR buffer holding `frame` scaled to the display size,
+        # or None while the view is hidden
+        box, visible = self.request
+        if not visible:
+            return None
+        size = fit_size(frame.shape, box)
+        if size != self.size:
+            self._allocate(size)
+
+        self.position = (self.position + 1) % len(self.slots)
+        bgr = self.slots[self.position][0]
+        if size == (frame.shape[1], frame.shape[0]):
+            # Already at display size: copy (overlays must not touch the captured frame)
+            np.copyto(bgr, frame)
+        else:
+            cv2.resize(frame, size, dst=bgr)
+        return bgr
+
+    def publish(self):
+        # Converts the current slot to RGBA and returns the PIL image backed by it
+        bgr, rgba, image = self.slots[self.position]
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGBA, dst=rgba)
+        return image
+
+    def render(self, frame):
+        if self.resize(frame) is None:
+            return None
+        return self.publish()
+
+
+class PhotoSurface:
+    # Tk side of DisplayBuffers: one persistent PhotoImage per label, updated in place with paste().
+    # Tracks the label's geometry and visibility (unmapped, iconified or fully obscured) and
+    # forwards them to the buffers so the worker renders at the size actually shown, or not at all.
+    def __init__(self, label, buffers, margin=4):
+        self.label = label
+        self.buffers = buffers
+        self.margin = margin
+        self.photo = None
+        self.obscured = False
+        self.iconified = False
+
+        label.bind('<Configure>', self._update, add='+')
+        label.bind('<Map>', self._update, add='+')
+        label.bind('<Unmap>', self._update, add='+')
+        label.bind('<Visibility>', self._on_visibility, add='+')
+        toplevel = label.winfo_toplevel()
+        toplevel.bind('<Unmap>', self._on_toplevel_state, add='+')
+        toplevel.bind('<Map>', self._on_toplevel_state, add='+')
+
+    def _on_visibility(self, event):
+        self.obscured = event.state == 'VisibilityFullyObscured'
+        self._update()
+
+    def _on_toplevel_state(self, event):
+        # Toplevel bindings also fire for its children; only the window itself matters here
+        if event.widget is self.label.winfo_toplevel():
+            self.iconified = event.type == EventType.Unmap
+            self._update()
+
+    def _update(self, event=None):
+        width = self.label.winfo_width() - self.margin
+        height = self.label.winfo_height() - self.margin
+        if width <= 1 or height <= 1:
+            # Not laid out yet: keep the current box
+            box = self.buffers.request[0]
+        else:
+            box = (width, height)
+        visible = bool(self.label.winfo_ismapped()) and not self.obscured and not self.iconified
+        self.buffers.set_target(box, visible)
+
+    def show(self, image):
+        if image is None:
+            return
+        if self.photo is None or (self.photo.width(), self.photo.height()) != image.size:
+            self.photo = ImageTk.PhotoImage(image.mode, image.size)
+            self.label.config(image=self.photo)
+        self.photo.paste(image)
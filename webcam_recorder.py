@@ -0,0 +1,91 @@
+import os
+import queue
+import threading
+
+import cv2
+
+INDEX_COLUMNS = ('frame_number', 'capture_index', 'timestamp', 'video_frame', 'video_time')
+
+
+def index_path_for(video_path):
+    return os.path.splitext(video_path)[0] + '.frames.csv'
+
+
+class WebcamRecorder:
+    # Encodes captured webcam frames with cv2.VideoWriter on its own thread and writes a
+    # sidecar index (<name>.frames.csv) with the capture timestamp of every stored frame.
+    # submit() never blocks: when the encoder falls behind, frames are dropped and counted
+    # so recording cannot slow down the capture or the tracking loop.
+    # MJPG in an AVI container is available in every OpenCV build, hence the default.
+    def __init__(self, file_path, fps, frame_size, fourcc='MJPG', max_pending=120):
+        self.file_path = file_path
+        self.index_path = index_path_for(file_path)
+        self.writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*fourcc), fps, frame_size)
+        if not self.writer.isOpened():
+            raise IOError(f"Impossibile creare la registrazione webcam: {file_path}")
+
+        self.queue = queue.Queue(max_pending)
+        self.closed = False
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+        self.index_file = open(self.index_path, 'w')
+        self.index_file.write(",".join(INDEX_COLUMNS) + "\n")
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, captured):
+        # captured: CapturedFrame; the frame is only read, never modified
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(captured)
+            return True
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            captured = self.queue.get()
+            if captured is None:
+                break
+
+            self.writer.write(captured.frame)
+            media = captured.media
+            video_frame = media.frame_index if media else -1
+            video_time = media.video_time if media else 0.0
+            self.index_file.write(
+                f"{self.frames_written},{captured.index},{captured.timestamp},{video_frame},{video_time}\n")
+            self.frames_written += 1
+
+        self.writer.release()
+        self.index_file.close()
+
+
+def load_frame_index(index_path):
+    # Returns the sidecar rows as dicts, in recording order
+    rows = []
+    with open(index_path) as f:
+        header = f.readline().strip().split(",")
+        for line in f:
+            values = line.strip().split(",")
+            if len(values) != len(header):
+                continue
+            row = dict(zip(header, values))
+            rows.append({
+                'frame_number': int(row['frame_number']),
+                'capture_index': int(row['capture_index']),
+                'timestamp': float(row['timestamp']),
+                'video_frame': int(row['video_frame']),
+                'video_time': float(row['video_time'])
+            })
+    return rows